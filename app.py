@@ -2,19 +2,58 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from models import setup_db, Movie, Actor
-from auth.auth import AUTH0_DOMAIN, CLIENT_ID, REDIRECT_URL, LOGOUT_URL, \
-    API_AUDIENCE, AuthError, requires_auth
+from models import db, setup_db, insert_many, update_many, delete_many, \
+    insert_row, update_row, delete_row, get_many, select_fields, Movie, \
+    Actor, Casting
+from pagination import get_page_args, get_limit, paginate
+from export import EXPORT_FORMATS, stream_export
+from fields import get_fields, get_includes, serialize
+from conditional import conditional
+from compression import compressed
+from cache import cached, response_cache, response_flights, setup_cache
+from pool import pool_stats
+from metrics import RequestMetrics, request_metrics
+from json_provider import json_response, setup_json
+from replicas import read_only
+from changes import get_since, get_changes
+from search import filter_actors, filter_movies, movie_sort
+from bulk import read_bulk_body, validate_rows, parse_ids, read_ids, \
+    read_patch, read_patches
+from auth.auth import AuthError, requires_auth, setup_auth
+from config import Config
 from flask_migrate import Migrate
 
 
-# db = SQLAlchemy()
+def lookup(model, key, ids):
+    """Respond with the rows for `ids`, in that order, and the missing ids."""
+    fields = get_fields(model)
+    includes = get_includes(model)
+    if fields and includes:
+        abort(400)
+    if not includes:
+        fields = fields or list(model.public_fields)
+
+    rows, missing = get_many(model, ids, fields, includes)
+    return json_response({
+        'success': True,
+        key: [serialize(row, fields, includes) for row in rows],
+        'missing': missing
+    })
 
 
 def create_app(test_config=None):
+    """Build the app. This does no I/O, so it is safe to call at import."""
     app = Flask(__name__)
-    # migrate = Migrate(app, db)
+    app.config.from_object(Config())
+    if test_config is not None:
+        app.config.update(test_config)
+
+    RequestMetrics().init_app(app)
     setup_db(app)
+    setup_auth(app)
+    setup_cache(app)
+    setup_json(app)
+    Migrate(app, db)
     CORS(app, resources={r"/api/*"})
 
     @app.after_request
@@ -40,11 +79,12 @@ def create_app(test_config=None):
     @app.route("/authorization/url", methods=["GET"])
     def generate_auth_url():
         """This endpoint will allow you to generate an auth URL."""
-        url = f'https://{AUTH0_DOMAIN}/authorize' \
-            f'?audience={API_AUDIENCE}' \
+        config = app.config
+        url = f'https://{config["AUTH0_DOMAIN"]}/authorize' \
+            f'?audience={config["API_AUDIENCE"]}' \
             f'&response_type=token&client_id=' \
-            f'{CLIENT_ID}&redirect_uri=' \
-            f'{REDIRECT_URL}'
+            f'{config["CLIENT_ID"]}&redirect_uri=' \
+            f'{config["REDIRECT_URL"]}'
         return jsonify({
             'message': 'Click this link to sign in.',
             'url': url
@@ -55,8 +95,9 @@ def create_app(test_config=None):
     @app.route('/authorization/logout', methods=['GET'])
     def generate_logout_url():
         """This endpoint will clear your Auth0 session."""
-        url = f'https://{AUTH0_DOMAIN}/v2/logout?federated&' \
-            f'client_id={CLIENT_ID}&returnTo={LOGOUT_URL}'
+        config = app.config
+        url = f'https://{config["AUTH0_DOMAIN"]}/v2/logout?federated&' \
+            f'client_id={config["CLIENT_ID"]}&returnTo={config["LOGOUT_URL"]}'
 
         return jsonify({
             'message': 'Click this link to logout of your Auth0 session.',
@@ -72,54 +113,219 @@ def create_app(test_config=None):
 
     @app.route('/api/actors')
     @requires_auth('get:actors')
+    @read_only
+    @conditional(Actor)
+    @cached(Actor)
     def get_actors(payload):
-        """This endpoint will retrieve all actors."""
+        """This endpoint will retrieve and search a page of actors."""
+        if 'ids' in request.args:
+            return lookup(Actor, 'actors', parse_ids(request.args['ids']))
+
+        after, limit = get_page_args(Actor.id)
+        fields = get_fields(Actor)
+        includes = get_includes(Actor)
+        if fields and includes:
+            abort(400)
+
+        if includes:
+            query = Actor.with_includes(Actor.query, includes)
+        else:
+            fields = fields or list(Actor.public_fields)
+            query = select_fields(Actor, fields)
+        query = filter_actors(query, Actor)
+
         try:
-            actors = Actor.query.all()
+            actors, next_cursor = paginate(query, Actor.id, after, limit,
+                                           core=not includes)
 
-            return jsonify({
+            return json_response({
                 'success': True,
-                'actors': [actor.format() for actor in actors]
-            }), 200
+                'actors': [serialize(actor, fields, includes)
+                           for actor in actors],
+                'next_cursor': next_cursor
+            })
         except BaseException:
             abort(401)
 
     @app.route('/api/movies')
     @requires_auth('get:movies')
+    @read_only
+    @conditional(Movie)
+    @cached(Movie)
     def get_movies(payload):
-        """This endpoint will retrieve all movies."""
+        """This endpoint will retrieve and search a page of movies."""
+        if 'ids' in request.args:
+            return lookup(Movie, 'movies', parse_ids(request.args['ids']))
+
+        sort_columns, descending = movie_sort(Movie)
+        after, limit = get_page_args(sort_columns)
+        fields = get_fields(Movie)
+        includes = get_includes(Movie)
+        if fields and includes:
+            abort(400)
+        if fields and sort_columns[0] is Movie.released_on and \
+                'released_on' not in fields:
+            fields.append('released_on')
+
+        if includes:
+            query = Movie.with_includes(Movie.query, includes)
+        else:
+            fields = fields or list(Movie.public_fields)
+            query = select_fields(Movie, fields)
+        query = filter_movies(query, Movie)
+
         try:
-            movies = Movie.query.all()
+            movies, next_cursor = paginate(
+                query, sort_columns, after, limit, descending,
+                core=not includes)
 
-            return jsonify({
+            return json_response({
                 'success': True,
-                'movies': [movie.format() for movie in movies]
+                'movies': [serialize(movie, fields, includes)
+                           for movie in movies],
+                'next_cursor': next_cursor
             })
         except BaseException:
             abort(401)
 
+    @app.route('/api/actors/lookup', methods=['POST'])
+    @requires_auth('get:actors')
+    @read_only
+    def lookup_actors(payload):
+        """This endpoint will fetch many actors by ID from a JSON body."""
+        return lookup(Actor, 'actors', read_ids())
+
+    @app.route('/api/movies/lookup', methods=['POST'])
+    @requires_auth('get:movies')
+    @read_only
+    def lookup_movies(payload):
+        """This endpoint will fetch many movies by ID from a JSON body."""
+        return lookup(Movie, 'movies', read_ids())
+
+    @app.route('/api/actors/export')
+    @requires_auth('get:actors')
+    @read_only
+    @compressed
+    def export_actors(payload):
+        """This endpoint will stream every actor as NDJSON or CSV."""
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            abort(400)
+
+        return stream_export(Actor.query.order_by(Actor.id), export_format)
+
+    @app.route('/api/movies/export')
+    @requires_auth('get:movies')
+    @read_only
+    @compressed
+    def export_movies(payload):
+        """This endpoint will stream every movie as NDJSON or CSV."""
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            abort(400)
+
+        return stream_export(Movie.query.order_by(Movie.id), export_format)
+
     @app.route('/api/actors/<int:id>', methods=['GET'])
     @requires_auth('get:actors')
+    @read_only
+    @conditional(Actor)
+    @cached(Actor, 'id')
     def view_actor(payload, id):
         """This endpoint will show an actor by ID"""
-        actor = Actor.query.get(id)
+        fields = get_fields(Actor)
+        includes = get_includes(Actor)
+        if fields and includes:
+            abort(400)
 
-        return jsonify({
+        if fields:
+            actor = select_fields(Actor, fields).filter(Actor.id == id).first()
+        elif includes:
+            actor = Actor.with_includes(Actor.query, includes) \
+                .filter(Actor.id == id).first()
+        else:
+            actor = Actor.query.get(id)
+
+        if actor is None:
+            abort(404)
+
+        return json_response({
             'success': True,
-            'actor': actor.format()
+            'actor': serialize(actor, fields, includes)
         })
 
     @app.route('/api/movies/<int:id>', methods=['GET'])
     @requires_auth('get:movies')
+    @read_only
+    @conditional(Movie)
+    @cached(Movie, 'id')
     def view_movie(payload, id):
         """This endpoint will show a movie by ID"""
-        movie = Movie.query.get(id)
+        fields = get_fields(Movie)
+        includes = get_includes(Movie)
+        if fields and includes:
+            abort(400)
+
+        if fields:
+            movie = select_fields(Movie, fields).filter(Movie.id == id).first()
+        elif includes:
+            movie = Movie.with_includes(Movie.query, includes) \
+                .filter(Movie.id == id).first()
+        else:
+            movie = Movie.query.get(id)
+
+        if movie is None:
+            abort(404)
+
+        return json_response({
+            'success': True,
+            'movie': serialize(movie, fields, includes)
+        })
+
+    @app.route('/api/changes')
+    @requires_auth('get:actors', 'get:movies')
+    @read_only
+    @conditional(Actor, Movie)
+    @compressed
+    def list_changes(payload):
+        """This endpoint will list actor and movie changes since a cursor."""
+        models = (Actor, Movie)
+        changes, next_cursor, has_more = get_changes(
+            models, get_since(models), get_limit())
+
+        return json_response({
+            'success': True,
+            'changes': changes,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
 
+    @app.route('/api/diagnostics/cache')
+    @requires_auth(app.config['DIAGNOSTICS_PERMISSION'])
+    def cache_stats(payload):
+        """This endpoint will show response cache hit ratio and size."""
         return jsonify({
             'success': True,
-            'movie': movie.format()
+            'cache': response_cache.stats(),
+            'single_flight': response_flights.stats()
         })
 
+    @app.route('/api/diagnostics/pool')
+    @requires_auth(app.config['DIAGNOSTICS_PERMISSION'])
+    def database_pool_stats(payload):
+        """This endpoint will show live database connection pool usage."""
+        return jsonify({
+            'success': True,
+            'pool': pool_stats(db.engine)
+        })
+
+    @app.route('/metrics')
+    def metrics():
+        """This endpoint will export request metrics for Prometheus."""
+        return app.response_class(
+            request_metrics.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/api/actors', methods=['POST'])
     @requires_auth('post:actor')
     def create_actor(payload):
@@ -127,66 +333,113 @@ def create_app(test_config=None):
         data = request.get_json()
 
         try:
-            new_actor = Actor()
-            new_actor.name = data['name']
-            new_actor.age = data['age']
-            new_actor.gender = data['gender']
-
-            new_actor.insert()
+            actor = insert_row(Actor, {
+                'name': data['name'],
+                'age': data['age'],
+                'gender': data['gender']
+            })
 
         except BaseException:
+            db.session.rollback()
             abort(400)
 
+        return json_response({
+            'success': True,
+            'actor': actor
+        })
+
+    @app.route('/api/actors/bulk', methods=['POST'])
+    @requires_auth('post:actor')
+    def bulk_create_actors(payload):
+        """This endpoint will create many actors in one transaction."""
+        rows, errors = validate_rows(read_bulk_body(), Actor.field_types)
+
+        try:
+            insert_many(Actor, rows)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+
         return jsonify({
             'success': True,
-            'actor': new_actor.format()
+            'created': len(rows),
+            'errors': errors
         }), 200
 
-    @app.route('/api/actors/<int:id>', methods=['PATCH'])
+    @app.route('/api/actors', methods=['PATCH'])
     @requires_auth('patch:actor')
-    def update_actor(payload, id):
-        """This endpoint will allow one to edit an actor"""
-        actor = Actor.query.get(id)
+    def batch_update_actors(payload):
+        """This endpoint will edit many actors in one transaction."""
+        patches = read_patches(Actor.field_types)
 
-        if actor is None:
-            abort(404)
+        try:
+            updated = update_many(Actor, patches)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
 
-        data = request.get_json()
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'missing': sorted(set(patches) - set(updated))
+        }), 200
 
-        if 'name' in data:
-            actor.name = data['name']
-        if 'age' in data:
-            actor.age = data['age']
-        if 'gender' in data:
-            actor.gender = data['gender']
+    @app.route('/api/actors', methods=['DELETE'])
+    @requires_auth('delete:actor')
+    def batch_delete_actors(payload):
+        """This endpoint will delete many actors by ID."""
+        ids = parse_ids(request.args.get('ids'))
 
-        actor.update()
+        try:
+            deleted = delete_many(Actor, ids)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
 
         return jsonify({
             'success': True,
-            'actor': actor.format()
+            'deleted': deleted,
+            'missing': sorted(set(ids) - set(deleted))
         }), 200
 
-    @app.route('/api/actors/<int:id>', methods=['DELETE'])
-    @requires_auth('delete:actor')
-    def delete_actor(payload, id):
+    @app.route('/api/actors/<int:id>', methods=['PATCH'])
+    @requires_auth('patch:actor')
+    def update_actor(payload, id):
+        """This endpoint will allow one to edit an actor"""
+        changes = read_patch(Actor.field_types)
 
         try:
-            actor = Actor.query.get(id)
+            actor = update_row(Actor, id, changes)
+        except BaseException:
+            db.session.rollback()
+            abort(400)
 
-            if actor is None:
-                abort(404)
+        if actor is None:
+            abort(404)
 
-            actor.delete()
+        return json_response({
+            'success': True,
+            'actor': actor
+        })
 
-            return jsonify({
-                'success': True,
-                'delete': actor.format()
-            }), 200
+    @app.route('/api/actors/<int:id>', methods=['DELETE'])
+    @requires_auth('delete:actor')
+    def delete_actor(payload, id):
 
+        try:
+            actor = delete_row(Actor, id)
         except BaseException:
+            db.session.rollback()
             abort(401)
 
+        if actor is None:
+            abort(404)
+
+        return json_response({
+            'success': True,
+            'delete': actor
+        })
+
     @app.route('/api/movies', methods=['POST'])
     @requires_auth('post:movie')
     def create_movies(payload):
@@ -194,55 +447,156 @@ def create_app(test_config=None):
         data = request.get_json()
 
         try:
-            new_movie = Movie()
-            new_movie.title = data['title']
-            new_movie.release_date = data['release_date']
-
-            new_movie.insert()
+            movie = insert_row(Movie, {
+                'title': data['title'],
+                'release_date': data['release_date']
+            })
 
-            return jsonify({
+            return json_response({
                 'success': True,
-                "movie": new_movie.format()
-            }), 200
+                "movie": movie
+            })
 
         except BaseException:
+            db.session.rollback()
             abort(401)
 
+    @app.route('/api/movies/bulk', methods=['POST'])
+    @requires_auth('post:movie')
+    def bulk_create_movies(payload):
+        """This endpoint will create many movies in one transaction."""
+        rows, errors = validate_rows(read_bulk_body(), Movie.field_types)
+
+        try:
+            insert_many(Movie, rows)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'created': len(rows),
+            'errors': errors
+        }), 200
+
+    @app.route('/api/movies', methods=['PATCH'])
+    @requires_auth('patch:movie')
+    def batch_update_movies(payload):
+        """This endpoint will edit many movies in one transaction."""
+        patches = read_patches(Movie.field_types)
+
+        try:
+            updated = update_many(Movie, patches)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'missing': sorted(set(patches) - set(updated))
+        }), 200
+
+    @app.route('/api/movies', methods=['DELETE'])
+    @requires_auth('delete:movie')
+    def batch_delete_movies(payload):
+        """This endpoint will delete many movies by ID."""
+        ids = parse_ids(request.args.get('ids'))
+
+        try:
+            deleted = delete_many(Movie, ids)
+        except BaseException:
+            db.session.rollback()
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'deleted': deleted,
+            'missing': sorted(set(ids) - set(deleted))
+        }), 200
+
     @app.route('/api/movies/<int:id>', methods=['PATCH'])
     @requires_auth('patch:movie')
     def update_movies(payload, id):
         """This endpoint will allow one to edit a movie by ID."""
-        movie = Movie.query.get(id)
+        changes = read_patch(Movie.field_types)
+
+        try:
+            movie = update_row(Movie, id, changes)
+        except BaseException:
+            db.session.rollback()
+            abort(400)
 
         if movie is None:
             abort(404)
 
-        data = request.get_json()
+        return json_response({
+            'success': True,
+            'movie': movie
+        })
+
+    @app.route('/api/movies/<int:id>/cast', methods=['POST'])
+    @requires_auth('patch:movie')
+    def cast_actor(payload, id):
+        """This endpoint will cast an actor in a movie, or recast them."""
+        data = request.get_json(silent=True) or {}
+        actor_id = data.get('actor_id')
+        billing_order = data.get('billing_order')
+        if not isinstance(actor_id, int) or \
+                not isinstance(billing_order, (int, type(None))):
+            abort(400)
+
+        if Movie.query.get(id) is None or Actor.query.get(actor_id) is None:
+            abort(404)
 
-        if 'title' in data:
-            movie.title = data['title']
-        if 'release_date' in data:
-            movie.release_date = data['release_date']
+        casting = Casting.query.get((id, actor_id))
+        if casting is None:
+            casting = Casting(movie_id=id, actor_id=actor_id)
+            db.session.add(casting)
+        casting.role = data.get('role')
+        casting.billing_order = billing_order
 
-        movie.update()
+        try:
+            casting.insert()
+        except BaseException:
+            db.session.rollback()
+            abort(422)
 
         return jsonify({
             'success': True,
-            'movie': movie.format()
+            'casting': casting.format()
+        }), 200
+
+    @app.route('/api/movies/<int:id>/cast/<int:actor_id>',
+               methods=['DELETE'])
+    @requires_auth('patch:movie')
+    def uncast_actor(payload, id, actor_id):
+        """This endpoint will remove an actor from a movie's cast."""
+        casting = Casting.query.get((id, actor_id))
+
+        if casting is None:
+            abort(404)
+
+        casting.delete()
+
+        return jsonify({
+            'success': True,
+            'deleted': casting.format()
         }), 200
 
     @app.route('/api/movies/<int:id>', methods=['DELETE'])
     @requires_auth('delete:movie')
     def delete_movie(payload, id):
         """This endpoint will allow you to delete a movie by ID"""
-        movie = Movie.query.get(id)
+        movie = delete_row(Movie, id)
 
-        movie.delete()
+        if movie is None:
+            abort(404)
 
-        return jsonify({
+        return json_response({
             'success': True,
-            'deleted': movie.format()
-        }), 200
+            'deleted': movie
+        })
 
     # Error Handlers
     @app.errorhandler(AuthError)
@@ -281,6 +635,15 @@ def create_app(test_config=None):
             'message': 'This resoure has not been found.'
         }), 404
 
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        """Payload too large error handler."""
+        return jsonify({
+            "success": False,
+            "error": 413,
+            "message": "Too many rows in one request."
+        }), 413
+
     @app.errorhandler(422)
     def unprocessable(error):
         """Unprocessable entity error handeler."""
@@ -302,8 +665,5 @@ def create_app(test_config=None):
     return app
 
 
-app = create_app()
-
-
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
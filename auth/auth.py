@@ -1,17 +1,31 @@
-import os
-import json
-from flask import request
+import time
+from flask import request, g, current_app
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from werkzeug.local import LocalProxy
+from .jwks import JWKSCache
+from .token_cache import TokenCache
 
 
-AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
-ALGORITHMS = os.environ['ALGORITHMS']
-API_AUDIENCE = os.environ['API_AUDIENCE']  # unique identifier
-CLIENT_ID = os.environ['CLIENT_ID']
-REDIRECT_URL = os.environ['REDIRECT_URL']
-LOGOUT_URL = os.environ['LOGOUT_URL']
+# Signing keys are cached in-process. Set JWKS_URL to a local file
+# (file:///path/to/jwks.json) or stub server to run without Auth0.
+jwks_cache = LocalProxy(lambda: current_app.extensions['jwks_cache'])
+
+# Verified payloads, so repeat requests with the same bearer token skip the
+# signature check. Entries expire with the token itself.
+token_cache = LocalProxy(lambda: current_app.extensions['token_cache'])
+
+
+def setup_auth(app):
+    """Give the app its own key and token caches, built from its config."""
+    config = app.config
+    app.extensions['jwks_cache'] = JWKSCache(
+        config.get('JWKS_URL') or
+        f'https://{config["AUTH0_DOMAIN"]}/.well-known/jwks.json',
+        ttl=config.get('JWKS_TTL', 600),
+        min_refetch_interval=config.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+    app.extensions['token_cache'] = TokenCache(
+        max_size=config.get('TOKEN_CACHE_SIZE', 1024))
 
 
 # Error handler
@@ -22,6 +36,14 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class Payload(dict):
+    """A decoded token payload with its permissions precomputed."""
+
+    def __init__(self, claims):
+        super().__init__(claims)
+        self.permission_set = frozenset(claims.get('permissions', ()))
+
+
 def get_token_auth_header():
     """This returns a token from a header in a request."""
     # get the Authorization headers
@@ -49,15 +71,33 @@ def get_token_auth_header():
     return header_parts[1]
 
 
-def check_permissions(permission, payload):
-    """Verifies the correct permissions are included to access an endpoint."""
+def check_permissions(permission, payload, match='all'):
+    """Verifies the correct permissions are included to access an endpoint.
+
+    `permission` is a single permission or a collection of them. With
+    match='all' every one is required, with match='any' one is enough.
+    """
     if 'permissions' not in payload:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'You do not have permission to access this data.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    if isinstance(permission, str):
+        required = frozenset((permission,))
+    else:
+        required = frozenset(permission)
+
+    granted = getattr(payload, 'permission_set', None)
+    if granted is None:
+        granted = frozenset(payload['permissions'])
+
+    if match == 'any':
+        allowed = not required or not required.isdisjoint(granted)
+    else:
+        allowed = required <= granted
+
+    if not allowed:
         raise AuthError({
             'code': 'unauthorized',
             'description': 'You do not possess the correct permissions.',
@@ -67,8 +107,6 @@ def check_permissions(permission, payload):
 
 def verify_decode_jwt(token):
     """This will decode a a token."""
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -77,23 +115,24 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    config = current_app.config
+    key = jwks_cache.get_key(unverified_header['kid'])
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
                 token,
                 rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                algorithms=config['ALGORITHMS'],
+                audience=config['API_AUDIENCE'],
+                issuer='https://' + config['AUTH0_DOMAIN'] + '/'
             )
 
             return payload
@@ -121,14 +160,32 @@ def verify_decode_jwt(token):
     }, 400)
 
 
-def requires_auth(permission=''):
+def get_verified_payload(token):
+    """Return the payload of a token, verifying it only on a cache miss."""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = Payload(verify_decode_jwt(token))
+        token_cache.set(token, payload)
+    return payload
+
+
+def requires_auth(*permissions, match='all'):
+    """Require a valid token holding all (or any) of `permissions`."""
+    if match not in ('all', 'any'):
+        raise ValueError("match must be 'all' or 'any'")
+
     def requires_auth_decorator(f):
         """Pass the decoded payload if the permissions have been verfied."""
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            start = time.perf_counter()
+            try:
+                token = get_token_auth_header()
+                payload = get_verified_payload(token)
+                check_permissions(permissions, payload, match)
+            finally:
+                g.auth_seconds = time.perf_counter() - start
+            g.current_user = payload
             return f(payload, *args, **kwargs)
 
         return wrapper
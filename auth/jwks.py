@@ -0,0 +1,95 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSCache:
+    """Keeps the Auth0 signing keys in memory between requests.
+
+    Keys are fetched once and reused until `ttl` seconds have passed. Shortly
+    before they expire (`refresh_margin`) a background thread refreshes them
+    so requests never wait on the fetch. A token signed with an unknown `kid`
+    forces a refetch, but at most once every `min_refetch_interval` seconds so
+    bad tokens can't hammer the JWKS endpoint.
+
+    The url can be any scheme urlopen understands, so a local stub server or
+    a `file:///path/to/jwks.json` works for offline testing.
+    """
+
+    def __init__(self, url, ttl=600, refresh_margin=60,
+                 min_refetch_interval=30, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_fetch = None
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def fetch(self):
+        """Download and parse the JWKS document."""
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def get_key(self, kid):
+        """Return the JWK matching `kid`, or None if there isn't one."""
+        now = time.monotonic()
+
+        if now >= self._expires_at:
+            self._refresh_if_due()
+        elif now >= self._expires_at - self.refresh_margin:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._can_refetch(time.monotonic()):
+            self._refresh_if_due()
+            key = self._keys.get(kid)
+
+        return key
+
+    def _load(self):
+        jwks = self.fetch()
+        self._keys = {key['kid']: key for key in jwks.get('keys', [])}
+        self._expires_at = time.monotonic() + self.ttl
+
+    def _can_refetch(self, now):
+        return (self._last_fetch is None or
+                now - self._last_fetch >= self.min_refetch_interval)
+
+    def _refresh_if_due(self):
+        # Concurrent callers queue on the lock; only the first one fetches.
+        # If we have never loaded any keys a failed fetch is fatal, otherwise
+        # keep serving the stale keys until the endpoint comes back.
+        with self._fetch_lock:
+            if self._keys and not self._can_refetch(time.monotonic()):
+                return
+            self._last_fetch = time.monotonic()
+            try:
+                self._load()
+            except Exception:
+                if not self._keys:
+                    raise
+                logger.exception('Unable to refresh JWKS from %s', self.url)
+
+    def _refresh_in_background(self):
+        if self._refreshing or not self._can_refetch(time.monotonic()):
+            return
+        self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh_if_due()
+        except Exception:
+            logger.exception('Unable to refresh JWKS from %s', self.url)
+        finally:
+            self._refreshing = False
@@ -0,0 +1,105 @@
+"""Measure database queries under a thundering herd on one movie.
+
+Each round clears the response cache (as a write would), then releases
+--clients threads at once, all requesting the same movie. Each reported
+count is the number of statements the round ran, the table version lookup
+included. With single-flight coalescing it should be close to three per
+round: the table version lookup, the movie's row version for the cache
+entry, and the movie query. --query-latency adds a
+delay to every statement to stand in for a network round trip to
+PostgreSQL, so that the requests overlap as they do in production.
+
+    python benchmarks/herd.py --clients 50 --rounds 20
+    python benchmarks/herd.py --clients 50 --rounds 20 --no-single-flight
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+from benchmarks.load import sign_token, write_jwks  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--query-latency', type=float, default=5,
+                        help='milliseconds added to every statement')
+    parser.add_argument('--no-single-flight', action='store_true')
+    args = parser.parse_args()
+
+    from app import create_app
+    from cache import response_cache
+    from models import db, insert_row, Movie
+
+    with tempfile.TemporaryDirectory() as directory:
+        pem, jwks_path = write_jwks(directory)
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                directory, 'herd.db'),
+            'AUTH0_DOMAIN': 'benchmark.local',
+            'API_AUDIENCE': 'CastingAgency',
+            'ALGORITHMS': 'RS256',
+            'JWKS_URL': 'file://' + jwks_path,
+            'SINGLE_FLIGHT': not args.no_single_flight
+        })
+        with app.app_context():
+            db.create_all()
+            movie_id = insert_row(Movie, {'title': 'Premiere',
+                                          'release_date': '2030-01-01'})['id']
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *rest):
+            time.sleep(args.query_latency / 1000)
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+
+        headers = {'Authorization': 'Bearer ' + sign_token(pem)}
+        path = '/api/movies/{}'.format(movie_id)
+        per_round = []
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            with app.app_context():
+                response_cache.clear()
+            del statements[:]
+            barrier = threading.Barrier(args.clients)
+
+            def request():
+                barrier.wait()
+                response = app.test_client().get(path, headers=headers)
+                assert response.status_code == 200, response.status_code
+
+            threads = [threading.Thread(target=request)
+                       for _ in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            per_round.append(len(statements))
+        elapsed = time.perf_counter() - start
+
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+
+    print(json.dumps({
+        'single_flight': not args.no_single_flight,
+        'clients': args.clients,
+        'rounds': args.rounds,
+        'queries_per_round': sum(per_round) / len(per_round),
+        'max_queries_in_a_round': max(per_round),
+        'requests_per_second': args.clients * args.rounds / elapsed
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
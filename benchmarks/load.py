@@ -0,0 +1,306 @@
+"""Load test the API offline and save the results as JSON.
+
+The harness needs no Auth0 tenant and no existing database. It generates an
+RS256 key, serves the public half as a local JWKS file, and signs its own
+tokens. It migrates and seeds a fresh SQLite database (or the database in
+--database-url), then starts the app and drives the list, detail, create
+and patch routes from concurrent clients. It reports throughput and
+p50/p95/p99 latency per scenario.
+
+    python benchmarks/load.py --actors 10000 --movies 10000 \\
+        --concurrency 16 --duration 20 --output before.json
+    python benchmarks/load.py ... --output after.json --compare before.json
+
+--server gunicorn runs the app under gunicorn.conf.py instead of the
+threaded development server.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rsa  # noqa: E402
+from jose import jwk, jwt  # noqa: E402
+
+
+AUTH0_DOMAIN = 'benchmark.local'
+API_AUDIENCE = 'CastingAgency'
+KEY_ID = 'benchmark'
+PERMISSIONS = ['get:actors', 'get:movies', 'post:actor', 'patch:actor',
+               'delete:actor', 'post:movie', 'patch:movie', 'delete:movie']
+
+SCENARIOS = ('list', 'detail', 'create', 'patch')
+
+
+def write_jwks(directory):
+    """Create a signing key and a JWKS file for it.
+
+    Returns the private key PEM and the path of the JWKS file.
+    """
+    _, private_key = rsa.newkeys(2048)
+    pem = private_key.save_pkcs1().decode('ascii')
+
+    public = jwk.construct(pem, 'RS256').public_key().to_dict()
+    public = {name: value.decode('ascii') if isinstance(value, bytes)
+              else value for name, value in public.items()}
+    public.update(kid=KEY_ID, use='sig')
+
+    path = os.path.join(directory, 'jwks.json')
+    with open(path, 'w') as jwks_file:
+        json.dump({'keys': [public]}, jwks_file)
+    return pem, path
+
+
+def sign_token(pem, permissions=PERMISSIONS, lifetime=3600):
+    now = int(time.time())
+    return jwt.encode({
+        'iss': 'https://{}/'.format(AUTH0_DOMAIN),
+        'aud': API_AUDIENCE,
+        'sub': 'benchmark|1',
+        'iat': now,
+        'exp': now + lifetime,
+        'permissions': permissions
+    }, pem, algorithm='RS256', headers={'kid': KEY_ID})
+
+
+def app_environ(database_url, jwks_path):
+    environ = dict(os.environ)
+    environ.update({
+        'DATABASE_URL': database_url,
+        'AUTH0_DOMAIN': AUTH0_DOMAIN,
+        'API_AUDIENCE': API_AUDIENCE,
+        'ALGORITHMS': 'RS256',
+        'JWKS_URL': 'file://' + jwks_path
+    })
+    return environ
+
+
+def seed(app, actors, movies):
+    """Migrate the database and fill it with generated rows."""
+    from flask_migrate import upgrade
+    from models import Actor, Movie, insert_many
+
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        insert_many(Actor, [{
+            'name': 'Actor {}'.format(i),
+            'age': 18 + i % 60,
+            'gender': 'F' if i % 2 else 'M'
+        } for i in range(actors)], batch_size=250)
+        insert_many(Movie, [{
+            'title': 'Movie {}'.format(i),
+            'release_date': '{}-{:02d}-01'.format(1950 + i % 70, 1 + i % 12)
+        } for i in range(movies)], batch_size=250)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('The app did not start on port {}'.format(port))
+
+
+def start_server(kind, app, environ, port):
+    """Serve the app in a thread or a gunicorn process. Returns a stopper."""
+    if kind == 'gunicorn':
+        process = subprocess.Popen(
+            [shutil.which('gunicorn') or 'gunicorn', '--bind',
+             '127.0.0.1:{}'.format(port), '--access-logfile', '/dev/null',
+             'wsgi:app'], cwd=ROOT, env=environ)
+        wait_until_up(port)
+        return process.terminate
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    wait_until_up(port)
+    return server.shutdown
+
+
+class Client:
+    """One keep-alive connection issuing requests for a scenario."""
+
+    def __init__(self, port, token, actors, movies):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.headers = {'Authorization': 'Bearer ' + token,
+                        'Content-Type': 'application/json'}
+        self.actors = actors
+        self.movies = movies
+
+    def request(self, scenario):
+        if scenario == 'list':
+            method, path, body = 'GET', '/api/actors?limit=50', None
+        elif scenario == 'detail':
+            method, body = 'GET', None
+            path = '/api/movies/{}'.format(random.randint(1, self.movies))
+        elif scenario == 'create':
+            method, path = 'POST', '/api/actors'
+            body = {'name': 'Load Test', 'age': 30, 'gender': 'F'}
+        else:
+            method = 'PATCH'
+            path = '/api/actors/{}'.format(random.randint(1, self.actors))
+            body = {'age': random.randint(18, 80)}
+
+        start = time.perf_counter()
+        self.connection.request(
+            method, path, headers=self.headers,
+            body=json.dumps(body) if body is not None else None)
+        response = self.connection.getresponse()
+        response.read()
+        return time.perf_counter() - start, response.status
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(scenario, port, token, args):
+    """Hammer one scenario for `args.duration` seconds."""
+    deadline = time.monotonic() + args.duration
+
+    def worker(_):
+        client = Client(port, token, args.actors, args.movies)
+        latencies, errors = [], 0
+        while time.monotonic() < deadline:
+            seconds, status = client.request(scenario)
+            latencies.append(seconds)
+            errors += status >= 400
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for worker_latencies, _ in results
+                 for seconds in worker_latencies]
+    milliseconds = [seconds * 1000 for seconds in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(milliseconds, 0.50),
+        'p95_ms': percentile(milliseconds, 0.95),
+        'p99_ms': percentile(milliseconds, 0.99),
+        'mean_ms': statistics.mean(milliseconds) if milliseconds else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        ).stdout.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print each scenario's change against an earlier results file."""
+    for scenario, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(scenario)
+        if not previous:
+            continue
+        print('{:<8} throughput {:+.1%}  p95 {:+.1%}  p99 {:+.1%}'.format(
+            scenario,
+            current['throughput'] / previous['throughput'] - 1,
+            current['p95_ms'] / previous['p95_ms'] - 1,
+            current['p99_ms'] / previous['p99_ms'] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--actors', type=int, default=1000)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds to run each scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'),
+                        default='werkzeug')
+    parser.add_argument('--database-url',
+                        help='an empty database to migrate and seed '
+                        '(default: a temporary SQLite file)')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='an earlier results file')
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: ' + ', '.join(sorted(unknown)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        pem, jwks_path = write_jwks(directory)
+        database_url = args.database_url or 'sqlite:///' + os.path.join(
+            directory, 'benchmark.db')
+        environ = app_environ(database_url, jwks_path)
+        os.environ.update(environ)
+
+        from app import create_app
+        app = create_app()
+        seed(app, args.actors, args.movies)
+
+        port = free_port()
+        stop = start_server(args.server, app, environ, port)
+        token = sign_token(pem)
+        try:
+            results = {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                           time.gmtime()),
+                'settings': {
+                    'actors': args.actors,
+                    'movies': args.movies,
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'server': args.server,
+                    'database': database_url.split(':', 1)[0]
+                },
+                'scenarios': {scenario: run_scenario(scenario, port, token,
+                                                     args)
+                              for scenario in scenarios}
+            }
+        finally:
+            stop()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure the CPU cost per row of building a list response.
+
+Compares the old path, ORM objects formatted one by one and encoded by
+jsonify, with the current one: Core result tuples zipped into dicts and
+encoded by each available JSON provider. Rows are read from a temporary
+SQLite database, so the numbers are mostly Python-side work.
+
+    python benchmarks/serialize.py --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import jsonify  # noqa: E402
+from app import create_app  # noqa: E402
+from fields import serialize  # noqa: E402
+from json_provider import JSON_PROVIDERS, create_provider  # noqa: E402
+from models import db, insert_many, select_fields, Movie  # noqa: E402
+
+
+def orm_jsonify(limit):
+    movies = Movie.query.order_by(Movie.id).limit(limit).all()
+    return jsonify({'movies': [movie.format() for movie in movies]}) \
+        .get_data()
+
+
+def core_provider(provider):
+    fields = list(Movie.public_fields)
+
+    def build(limit):
+        query = select_fields(Movie, fields).order_by(Movie.id).limit(limit)
+        rows = db.session.execute(query.statement).fetchall()
+        return provider.dumps(
+            {'movies': [serialize(row, fields) for row in rows]},
+            sort_keys=True)
+
+    return build
+
+
+def measure(build, rows, repeat):
+    """Return the median CPU microseconds per row over `repeat` runs."""
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()
+        start = time.process_time()
+        build(rows)
+        timings.append((time.process_time() - start) / rows * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(
+                directory, 'serialize.db'),
+            'AUTH0_DOMAIN': 'benchmark.local'
+        })
+
+        with app.test_request_context():
+            db.create_all()
+            insert_many(Movie, [{
+                'title': 'Movie {}'.format(i),
+                'release_date': '{}-{:02d}-01'.format(1950 + i % 70,
+                                                      1 + i % 12)
+            } for i in range(args.rows)], batch_size=250)
+
+            paths = {'orm+jsonify': orm_jsonify}
+            for name in JSON_PROVIDERS:
+                try:
+                    provider = create_provider(name)
+                except RuntimeError:
+                    continue
+                paths['core+' + name] = core_provider(provider)
+
+            results = {name: measure(build, args.rows, args.repeat)
+                       for name, build in paths.items()}
+
+    print(json.dumps({
+        'rows': args.rows,
+        'cpu_us_per_row': results
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure how long it takes a worker to import and build the app.
+
+Each run happens in a fresh interpreter, like a gunicorn worker boot. It
+reports import time, create_app time, and the connections and SQL
+statements made while starting up. Pass --create-all to also run
+db.create_all(), as every worker used to before schema creation moved to
+`flask db upgrade`.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --runs 20 --create-all
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+counts = {{'connections': 0, 'statements': 0}}
+
+def connect(*args):
+    counts['connections'] += 1
+
+def execute(*args):
+    counts['statements'] += 1
+
+event.listen(Engine, 'connect', connect)
+event.listen(Engine, 'before_cursor_execute', execute)
+
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+if {create_all!r}:
+    from models import db
+    with app.app_context():
+        db.create_all()
+created = time.perf_counter()
+counts['import_ms'] = (imported - start) * 1000
+counts['create_app_ms'] = (created - imported) * 1000
+print(json.dumps(counts))
+'''
+
+
+def run_once(create_all):
+    code = CHILD.format(root=ROOT, create_all=create_all)
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def summarize(runs):
+    summary = {}
+    for name in ('import_ms', 'create_app_ms'):
+        values = [run[name] for run in runs]
+        summary[name] = {
+            'median': statistics.median(values),
+            'min': min(values),
+            'max': max(values)
+        }
+    summary['connections'] = runs[-1]['connections']
+    summary['statements'] = runs[-1]['statements']
+    summary['runs'] = len(runs)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--create-all', action='store_true',
+                        help='also run db.create_all() like the old startup')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        parser.error('DATABASE_URL must be set')
+
+    runs = [run_once(args.create_all) for _ in range(args.runs)]
+    print(json.dumps(summarize(runs), indent=2))
+
+
+if __name__ == '__main__':
+    main()
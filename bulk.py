@@ -0,0 +1,147 @@
+import json
+from flask import request, abort
+
+
+MAX_BULK_ROWS = 50000
+MAX_BATCH_IDS = 10000
+
+
+def read_bulk_body():
+    """Read a JSON array or an NDJSON body into a list of records.
+
+    NDJSON lines that aren't valid JSON are kept as None so they can be
+    reported against their line number instead of failing the request.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        records = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            abort(400)
+
+    if not records:
+        abort(400)
+    if len(records) > MAX_BULK_ROWS:
+        abort(413)
+    return records
+
+
+def validate_rows(records, field_types):
+    """Check every record in one pass.
+
+    Returns the rows that can be inserted and a list of
+    {'index': ..., 'message': ...} errors for the ones that can't.
+    """
+    rows = []
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index,
+                           'message': 'Each row must be a JSON object.'})
+            continue
+
+        row = {}
+        for name, field_type in field_types.items():
+            value = record.get(name)
+            if field_type is int and isinstance(value, str) and \
+                    value.isdigit():
+                value = int(value)
+            if not isinstance(value, field_type) or isinstance(value, bool):
+                errors.append({'index': index, 'message':
+                               "'{}' is missing or invalid.".format(name)})
+                break
+            row[name] = value
+        else:
+            rows.append(row)
+
+    return rows, errors
+
+
+def parse_ids(value):
+    """Parse a comma separated list of ids, aborting with a 400 if invalid."""
+    try:
+        ids = [int(id) for id in value.split(',') if id.strip()]
+    except (AttributeError, ValueError):
+        abort(400)
+
+    if not ids:
+        abort(400)
+    if len(ids) > MAX_BATCH_IDS:
+        abort(413)
+    return list(dict.fromkeys(ids))
+
+
+def read_ids():
+    """Read the ids from a {"ids": [...]} JSON body.
+
+    Aborts with a 400 if they're missing or not integers. Duplicates are
+    dropped and the order is kept.
+    """
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else None
+    if not isinstance(ids, list) or not ids or any(
+            not isinstance(id, int) or isinstance(id, bool) for id in ids):
+        abort(400)
+    if len(ids) > MAX_BATCH_IDS:
+        abort(413)
+    return list(dict.fromkeys(ids))
+
+
+def read_patches(field_types):
+    """Read a JSON array of patches, each holding an id and the changes.
+
+    Returns {id: {column: value}}. Any malformed patch fails the whole
+    request, since the batch runs as a single transaction.
+    """
+    records = request.get_json(silent=True)
+    if not isinstance(records, list) or not records:
+        abort(400)
+    if len(records) > MAX_BATCH_IDS:
+        abort(413)
+
+    patches = {}
+    for record in records:
+        if not isinstance(record, dict) or \
+                not isinstance(record.get('id'), int):
+            abort(400)
+
+        changes = {name: value for name, value in record.items()
+                   if name != 'id'}
+        if not changes:
+            abort(400)
+        check_changes(changes, field_types)
+
+        patches[record['id']] = changes
+    return patches
+
+
+def read_patch(field_types):
+    """Read the changes for a single row from a JSON object body.
+
+    Names that aren't in `field_types` are ignored, but a value of the
+    wrong type is a 400 rather than being stored as sent.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+
+    changes = {name: value for name, value in body.items()
+               if name in field_types}
+    check_changes(changes, field_types)
+    return changes
+
+
+def check_changes(changes, field_types):
+    """Abort with a 400 unless every change has its column's type."""
+    for name, value in changes.items():
+        field_type = field_types.get(name)
+        if field_type is None or not isinstance(value, field_type) or \
+                isinstance(value, bool):
+            abort(400)
@@ -0,0 +1,449 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from flask import g, request, current_app
+from werkzeug.local import LocalProxy
+from fields import related_tables
+from compression import get_encoding, compress_response, set_encoding
+from singleflight import SingleFlight
+
+
+class CacheBackend:
+    """The interface every response cache backend implements.
+
+    Values are bytes so a backend can live outside the process. Keys can be
+    grouped under tags, and popping a tag returns every key filed under it
+    so those keys can be deleted together.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None, tags=()):
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        raise NotImplementedError
+
+    def pop_tag(self, tag):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class LRUBackend(CacheBackend):
+    """An in-process LRU bounded by entry count and total value size."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        if len(value) > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, expires_at, tuple(tags))
+            self._bytes += len(value)
+            for tag in tags:
+                self._tags[tag].add(key)
+
+            while (len(self._entries) > self.max_entries or
+                   self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def pop_tag(self, tag):
+        with self._lock:
+            return self._tags.pop(tag, set())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key):
+        value, _, tags = self._entries.pop(key)
+        self._bytes -= len(value)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class MemoryBackend(CacheBackend):
+    """A dict standing in for a shared cache server in tests.
+
+    It behaves like a shared store: nothing is evicted, entries only go away
+    when they expire or are deleted, and tags are plain sets of keys.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._tags = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._values[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl=None, tags=()):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._values[key] = (value, expires_at)
+            for tag in tags:
+                self._tags[tag].add(key)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def pop_tag(self, tag):
+        with self._lock:
+            return self._tags.pop(tag, set())
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._values),
+                'bytes': sum(len(value) for value, _ in self._values.values())
+            }
+
+
+class ResponseCache:
+    """A read-through cache of serialized responses.
+
+    Entries are keyed by path, query string and the caller's permissions,
+    and tagged with the table (and row) they were built from so a write can
+    invalidate exactly the entries it affects.
+
+    The key also holds the versions of the tables the response is built
+    from, which is how writes from other workers are noticed. A detail view
+    is keyed without its own table's version and checked against its row's
+    version instead (see `cached`), so a write to one row leaves the
+    others cached.
+    """
+
+    def __init__(self, backend, ttl=30):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, so a response that was being built
+        # while a write landed is neither stored nor shared.
+        self.generation = 0
+
+    @staticmethod
+    def list_tag(table_name):
+        return '{}:list'.format(table_name)
+
+    @staticmethod
+    def row_tag(table_name, id):
+        return '{}:{}'.format(table_name, id)
+
+    def key(self, permissions, versions, encoding=None):
+        """Build the cache key for the current request.
+
+        `versions` are the {table_name: (version, updated_at)} the key
+        depends on, so a write committed by any worker changes the key even
+        though only this worker's writes invalidate its entries. Each
+        content encoding is cached as a separate variant.
+        """
+        parts = [request.path, '&'.join(sorted(
+            '{}={}'.format(name, value)
+            for name, value in request.args.items(multi=True))),
+            encoding or 'identity']
+        parts.extend('{}:{}'.format(name, version)
+                     for name, (version, _) in sorted(versions.items()))
+        parts.extend(sorted(permissions))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key, is_current=None):
+        """Return the value for `key`, if `is_current` accepts it."""
+        value = self.backend.get(key)
+        if value is not None and is_current is not None and \
+                not is_current(value):
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, tags):
+        self.backend.set(key, value, ttl=self.ttl, tags=tags)
+
+    def invalidate(self, table_name, id=None):
+        """Drop the cached lists of a table and, if given, one of its rows."""
+        self.generation += 1
+        tags = [self.list_tag(table_name)]
+        if id is not None:
+            tags.append(self.row_tag(table_name, id))
+
+        for tag in tags:
+            keys = self.backend.pop_tag(tag)
+            self.backend.delete_many(keys)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        self.generation += 1
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
+        stats.update(self.backend.stats())
+        return stats
+
+
+class VersionCache:
+    """Shares table version lookups between requests.
+
+    Versions are read at most once every VERSION_CACHE_SECONDS for each
+    key, and lookups that overlap share one query. A write from this
+    process drops them straight away, because it bumps the response cache
+    generation. A write from another worker is seen once the entry expires.
+    """
+
+    def __init__(self):
+        self.flights = SingleFlight()
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        generation = response_cache.generation
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation and now < entry[1]:
+            return entry[2]
+
+        versions = self.flights.do((key, generation), load)
+        ttl = current_app.config.get('VERSION_CACHE_SECONDS', 1.0)
+        if ttl > 0:
+            with self._lock:
+                self._entries[key] = (generation, now + ttl, versions)
+        return versions
+
+
+def create_backend(config):
+    """Return the cache backend named by RESPONSE_CACHE_BACKEND."""
+    if config.get('RESPONSE_CACHE_BACKEND', 'lru') == 'memory':
+        return MemoryBackend()
+    return LRUBackend(
+        max_entries=config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+        max_bytes=config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def setup_cache(app):
+    """Give the app its own response cache, built from its config."""
+    app.extensions['response_cache'] = ResponseCache(
+        create_backend(app.config),
+        ttl=app.config.get('RESPONSE_CACHE_TTL', 30))
+    app.extensions['response_flights'] = SingleFlight()
+    app.extensions['version_cache'] = VersionCache()
+
+
+# The current app's cache. Each gunicorn worker has its own LRU. Keys
+# include the table versions, so writes from other workers are never
+# missed; the TTL reclaims the entries those writes leave behind.
+response_cache = LocalProxy(lambda: current_app.extensions['response_cache'])
+
+# Cache misses for the same key that overlap share one database query.
+response_flights = LocalProxy(
+    lambda: current_app.extensions['response_flights'])
+
+version_cache = LocalProxy(lambda: current_app.extensions['version_cache'])
+
+
+def pack_entry(encoding, body, stamp=None):
+    """Store a body with the encoding it was compressed with, if any.
+
+    Detail entries also carry their `stamp`: the (table version, row
+    version) they were built at.
+    """
+    header = [encoding or '']
+    if stamp is not None:
+        header.extend(str(version) for version in stamp)
+    return ' '.join(header).encode('ascii') + b'\n' + body
+
+
+def unpack_entry(entry):
+    header, _, body = entry.partition(b'\n')
+    encoding, *stamp = header.decode('ascii').split(' ')
+    stamp = tuple(int(version) for version in stamp) or None
+    return encoding or None, stamp, body
+
+
+def get_row_version(model, id):
+    """Read one row's write version, or None if the row doesn't exist."""
+    return model.query.with_entities(model.version) \
+        .filter(model.id == id).scalar()
+
+
+def cached(model, id_arg=None):
+    """Serve a JSON view from the response cache.
+
+    List views are tagged with `model`'s list tag. For detail views pass the
+    name of the view argument holding the row id as `id_arg`. Responses that
+    include related rows are also tagged with the related tables' list tags.
+
+    List entries are keyed on the versions of every table they read, so
+    any write to the table misses them. Detail entries leave their own
+    table's version out of the key and store it with the row's version.
+    While the table version is unchanged a hit costs nothing. Once it moves
+    (a write to any row, possibly on another worker), the row's version is
+    read with one primary key lookup. If the row is unchanged, the entry
+    is served and restamped.
+
+    On a miss, identical requests that arrive while the view is running
+    wait for it and share its response (unless SINGLE_FLIGHT is off). So a
+    burst of requests for one key costs a single query per process.
+
+    Responses are compressed for clients that accept it before they are
+    stored, and each encoding is its own entry, so a hit is never
+    compressed again.
+
+    Use it under @conditional, which reads the table versions that go into
+    the key.
+    """
+    table_name = model.__tablename__
+
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(payload, *args, **kwargs):
+            permissions = getattr(payload, 'permission_set',
+                                  payload.get('permissions', ()))
+            encoding = get_encoding()
+            if 'table_versions' not in g:
+                raise RuntimeError('@cached views must be wrapped in '
+                                   '@conditional.')
+            versions = dict(g.table_versions)
+            if id_arg is None:
+                tags = [response_cache.list_tag(table_name)]
+            else:
+                id = kwargs[id_arg]
+                table_version = versions.pop(table_name)[0]
+                tags = [response_cache.row_tag(table_name, id)]
+            tags.extend(response_cache.list_tag(name)
+                        for name in related_tables(model)[1:])
+            key = response_cache.key(permissions, versions, encoding)
+
+            def is_current(entry):
+                body_encoding, stamp, body = unpack_entry(entry)
+                if stamp is None or stamp[0] == table_version:
+                    return True
+                generation = response_cache.generation
+                row_version = get_row_version(model, id)
+                if row_version != stamp[1]:
+                    return False
+                if response_cache.generation == generation:
+                    response_cache.set(key, pack_entry(
+                        body_encoding, body, (table_version, row_version)),
+                        tags)
+                return True
+
+            entry = response_cache.get(key, is_current)
+            if entry is not None:
+                body_encoding, _, body = unpack_entry(entry)
+                response = current_app.response_class(
+                    body, mimetype='application/json')
+                set_encoding(response, body_encoding)
+                return response
+
+            generation = response_cache.generation
+
+            def render():
+                # Read before the view runs, so a write that lands in
+                # between makes the stored stamp too old, never too new.
+                stamp = None if id_arg is None else \
+                    (table_version, get_row_version(model, id))
+                response = current_app.make_response(
+                    f(payload, *args, **kwargs))
+                body_encoding = compress_response(response, encoding)
+                body = response.get_data()
+                if response.status_code == 200 and \
+                        response_cache.generation == generation:
+                    response_cache.set(
+                        key, pack_entry(body_encoding, body, stamp), tags)
+                return response.status_code, list(response.headers), body
+
+            if current_app.config.get('SINGLE_FLIGHT', True):
+                status, headers, body = response_flights.do(
+                    (key, generation), render)
+            else:
+                status, headers, body = render()
+
+            return current_app.response_class(
+                body, status=status, headers=headers)
+
+        return wrapper
+    return cached_decorator
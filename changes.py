@@ -0,0 +1,106 @@
+from flask import request, abort
+from sqlalchemy import select, tuple_
+from models import db, get_versions, Tombstone
+from pagination import encode_cursor, decode_cursor
+
+
+# Where a feed with no `since` cursor starts: before every row, including
+# the ones that predate the feed and are still at version 0.
+START = (-1, 0)
+
+
+def get_since(models):
+    """Read the `since` cursor into {table_name: (version, id)}.
+
+    The cursor holds the position of the last change returned for each
+    table, as flat [version, id, version, id, ...] values in the order of
+    `models`.
+    """
+    since = request.args.get('since')
+    if not since:
+        return {model.__tablename__: START for model in models}
+
+    values = decode_cursor(since)
+    if len(values) != 2 * len(models) or \
+            not all(type(value) is int for value in values):
+        abort(400)
+    return {model.__tablename__: tuple(values[2 * i:2 * i + 2])
+            for i, model in enumerate(models)}
+
+
+def read_changes(model, after, until, limit):
+    """Return up to `limit` changes to `model` past the `after` position.
+
+    Inserts and updates come from the rows themselves and deletes from
+    their tombstones, merged in (version, id) order. Only versions up to
+    `until` are read: a writer holds its table's version until it commits,
+    so every version up to the one read from table_version is already
+    committed and none can turn up later behind the cursor.
+    """
+    table_name = model.__tablename__
+    table = model.__table__
+    rows = db.session.execute(
+        select([table.c[name] for name in model.public_fields] +
+               [table.c.version, table.c.updated_at])
+        .where(tuple_(table.c.version, table.c.id) > tuple_(*after))
+        .where(table.c.version <= until)
+        .order_by(table.c.version, table.c.id)
+        .limit(limit)).fetchall()
+
+    tombstone = Tombstone.__table__
+    tombstones = db.session.execute(
+        select([tombstone.c.row_id, tombstone.c.version,
+                tombstone.c.deleted_at])
+        .where(tombstone.c.table_name == table_name)
+        .where(tuple_(tombstone.c.version, tombstone.c.row_id) >
+               tuple_(*after))
+        .where(tombstone.c.version <= until)
+        .order_by(tombstone.c.version, tombstone.c.row_id)
+        .limit(limit)).fetchall()
+
+    changes = [{
+        'table': table_name,
+        'op': 'upsert',
+        'id': row.id,
+        'version': row.version,
+        'updated_at': row.updated_at,
+        'row': {name: row[name] for name in model.public_fields}
+    } for row in rows] + [{
+        'table': table_name,
+        'op': 'delete',
+        'id': row.row_id,
+        'version': row.version,
+        'deleted_at': row.deleted_at
+    } for row in tombstones]
+
+    changes.sort(key=lambda change: (change['version'], change['id']))
+    return changes[:limit]
+
+
+def get_changes(models, since, limit):
+    """Return one page of changes to `models` and the cursor after it.
+
+    Tables are read in the order of `models`, so a page only moves on to
+    the next table once the previous one is caught up. The returned cursor
+    is always set; callers keep it and pass it back as `since` next time.
+    """
+    until = get_versions([model.__tablename__ for model in models])
+    position = dict(since)
+
+    changes = []
+    for model in models:
+        table_name = model.__tablename__
+        changes.extend(read_changes(model, position[table_name],
+                                    until[table_name][0],
+                                    limit + 1 - len(changes)))
+        if len(changes) > limit:
+            break
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    for change in changes:
+        position[change['table']] = (change['version'], change['id'])
+
+    cursor = encode_cursor([value for model in models
+                            for value in position[model.__tablename__]])
+    return changes, cursor, has_more
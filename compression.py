@@ -0,0 +1,114 @@
+import gzip
+import zlib
+from functools import wraps
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def get_encoding():
+    """Pick the response encoding from the request's Accept-Encoding.
+
+    Returns 'br' or 'gzip', whichever the client accepts with the highest
+    quality (ties go to the order of COMPRESSION_ENCODINGS), or None to
+    send the body as it is. 'br' is skipped unless brotli is installed.
+    """
+    encodings = [encoding for encoding in
+                 current_app.config.get('COMPRESSION_ENCODINGS', ())
+                 if encoding != 'br' or brotli is not None]
+    if not encodings:
+        return None
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(body, encoding):
+    """Compress a whole body with `encoding` at the configured level."""
+    config = current_app.config
+    if encoding == 'br':
+        return brotli.compress(
+            body, quality=config.get('COMPRESSION_BROTLI_QUALITY', 4))
+    return gzip.compress(
+        body, compresslevel=config.get('COMPRESSION_LEVEL', 6))
+
+
+def compress_chunks(chunks, encoding, level, quality):
+    """Compress a streamed body chunk by chunk.
+
+    Each chunk is flushed as soon as it is compressed, so the client
+    receives it without waiting for the rest of the stream.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=quality)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        # wbits 16 + 15 writes a gzip header and trailer around the stream.
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def set_encoding(response, encoding):
+    """Mark `response` as varying by Accept-Encoding, and as encoded."""
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+
+
+def compress_response(response, encoding):
+    """Compress a buffered 200 response if it is big enough to be worth it.
+
+    Bodies shorter than COMPRESSION_MIN_SIZE bytes are sent as they are:
+    they would barely shrink, and fit in a packet anyway. Returns the
+    encoding that was applied, or None.
+    """
+    min_size = current_app.config.get('COMPRESSION_MIN_SIZE', 1024)
+    if encoding is None or response.status_code != 200 or \
+            len(response.get_data()) < min_size:
+        encoding = None
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    set_encoding(response, encoding)
+    return encoding
+
+
+def compressed(f):
+    """Compress a view's response for clients that accept it.
+
+    Buffered responses are compressed whole, above the size threshold.
+    Streamed responses (the exports) are compressed as they are sent.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        response = current_app.make_response(f(*args, **kwargs))
+        encoding = get_encoding()
+        if not response.is_streamed:
+            compress_response(response, encoding)
+            return response
+
+        if encoding is None or response.status_code != 200:
+            set_encoding(response, None)
+            return response
+
+        # Read the settings now, the stream is consumed after we return.
+        config = current_app.config
+        response.response = compress_chunks(
+            response.response, encoding,
+            config.get('COMPRESSION_LEVEL', 6),
+            config.get('COMPRESSION_BROTLI_QUALITY', 4))
+        response.headers.pop('Content-Length', None)
+        set_encoding(response, encoding)
+        return response
+
+    return wrapper
@@ -0,0 +1,79 @@
+import hashlib
+from functools import wraps
+from flask import g, request, make_response, current_app
+from cache import version_cache
+from models import db, get_versions
+from fields import related_tables
+from replicas import replica_router
+
+
+def get_validators(models):
+    """Build the ETag and Last-Modified for the current request.
+
+    Both come from the table_version rows of `models` (and of any tables
+    pulled in with `include`), so they can be worked out with a single
+    primary-key lookup instead of loading any rows, and usually without
+    even that (see VersionCache). The versions are kept on
+    `g.table_versions` for the response cache key.
+    """
+    tables = []
+    for model in models:
+        tables.extend(related_tables(model))
+    # Keyed by database as well, since a replica can lag the primary.
+    engine = replica_router.engine_for_request() or db.engine
+    versions = g.table_versions = version_cache.get(
+        (engine, tuple(tables)), lambda: get_versions(tables))
+
+    tag = '|'.join([request.full_path] + [
+        '{}:{}'.format(name, version)
+        for name, (version, _) in sorted(versions.items())])
+    etag = hashlib.sha1(tag.encode('utf-8')).hexdigest()
+
+    timestamps = [updated_at for _, updated_at in versions.values()
+                  if updated_at is not None]
+    last_modified = max(timestamps).replace(microsecond=0) \
+        if timestamps else None
+
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """Check the request's If-None-Match / If-Modified-Since headers."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if_modified_since = request.if_modified_since
+    if if_modified_since and last_modified:
+        return last_modified <= if_modified_since.replace(tzinfo=None)
+
+    return False
+
+
+def conditional(*models):
+    """Answer conditional GETs with a 304 before the view runs.
+
+    Successful responses get a strong ETag and Last-Modified header derived
+    from the write counters of `models`. The ETag is weak on compressed
+    responses, since their bytes differ from the uncompressed ones, and
+    If-None-Match is compared weakly so either form gets a 304.
+    """
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = get_validators(models)
+
+            if is_not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(
+                etag, weak='Content-Encoding' in response.headers)
+            if last_modified:
+                response.last_modified = last_modified
+            return response
+
+        return wrapper
+    return conditional_decorator
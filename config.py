@@ -0,0 +1,85 @@
+import os
+
+
+class Config:
+    """Application settings, read from the environment.
+
+    Nothing is read until an instance is created, so every module can be
+    imported (and an app built from a test config) without the full
+    environment being set.
+    """
+
+    def __init__(self, environ=None):
+        environ = os.environ if environ is None else environ
+
+        # Database
+        self.SQLALCHEMY_DATABASE_URI = environ.get('DATABASE_URL')
+        self.SQLALCHEMY_TRACK_MODIFICATIONS = False
+        self.DATABASE_REPLICA_URLS = [
+            url.strip() for url in
+            environ.get('DATABASE_REPLICA_URLS', '').split(',')
+            if url.strip()]
+        self.REPLICA_STICKY_SECONDS = int(
+            environ.get('REPLICA_STICKY_SECONDS', 5))
+
+        # Connection pool, per worker (SQLite only uses pre-ping)
+        self.DB_POOL_SIZE = int(environ.get('DB_POOL_SIZE', 5))
+        self.DB_MAX_OVERFLOW = int(environ.get('DB_MAX_OVERFLOW', 10))
+        self.DB_POOL_TIMEOUT = int(environ.get('DB_POOL_TIMEOUT', 30))
+        self.DB_POOL_RECYCLE = int(environ.get('DB_POOL_RECYCLE', 1800))
+        self.DB_POOL_PRE_PING = environ.get(
+            'DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+        # Response cache for the read routes ('lru' or 'memory')
+        self.RESPONSE_CACHE_BACKEND = environ.get(
+            'RESPONSE_CACHE_BACKEND', 'lru')
+        self.RESPONSE_CACHE_TTL = int(environ.get('RESPONSE_CACHE_TTL', 30))
+        self.RESPONSE_CACHE_MAX_ENTRIES = int(
+            environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+        self.RESPONSE_CACHE_MAX_BYTES = int(
+            environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+        # Share one query between identical concurrent cache misses
+        self.SINGLE_FLIGHT = environ.get(
+            'SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes')
+
+        # How long table versions (for ETags and cache keys) are reused
+        # before they are read again; 0 reads them for every request
+        self.VERSION_CACHE_SECONDS = float(
+            environ.get('VERSION_CACHE_SECONDS', 1.0))
+
+        # 'auto' (orjson when installed), 'orjson' or 'json'
+        self.JSON_PROVIDER = environ.get('JSON_PROVIDER', 'auto')
+
+        # Response compression, in order of preference. 'br' needs brotli.
+        self.COMPRESSION_ENCODINGS = [
+            encoding.strip() for encoding in
+            environ.get('COMPRESSION_ENCODINGS', 'br,gzip').split(',')
+            if encoding.strip()]
+        self.COMPRESSION_MIN_SIZE = int(
+            environ.get('COMPRESSION_MIN_SIZE', 1024))
+        self.COMPRESSION_LEVEL = int(environ.get('COMPRESSION_LEVEL', 6))
+        self.COMPRESSION_BROTLI_QUALITY = int(
+            environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+
+        # Requests slower than this are logged with their slowest statements
+        self.SLOW_REQUEST_SECONDS = float(
+            environ.get('SLOW_REQUEST_SECONDS', 1.0))
+        self.SLOW_REQUEST_STATEMENTS = int(
+            environ.get('SLOW_REQUEST_STATEMENTS', 3))
+
+        # Authorization
+        self.AUTH0_DOMAIN = environ.get('AUTH0_DOMAIN')
+        self.ALGORITHMS = environ.get('ALGORITHMS', 'RS256')
+        self.API_AUDIENCE = environ.get('API_AUDIENCE')
+        self.CLIENT_ID = environ.get('CLIENT_ID')
+        self.REDIRECT_URL = environ.get('REDIRECT_URL')
+        self.LOGOUT_URL = environ.get('LOGOUT_URL')
+        self.JWKS_URL = environ.get('JWKS_URL')
+        self.JWKS_TTL = int(environ.get('JWKS_TTL', 600))
+        self.JWKS_MIN_REFETCH_INTERVAL = int(
+            environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+        self.TOKEN_CACHE_SIZE = int(environ.get('TOKEN_CACHE_SIZE', 1024))
+        # Needed for the /api/diagnostics routes, which show server internals
+        self.DIAGNOSTICS_PERMISSION = environ.get(
+            'DIAGNOSTICS_PERMISSION', 'read:diagnostics')
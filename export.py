@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from itertools import islice
+from flask import Response, stream_with_context
+
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def batches(records, size):
+    """Group an iterable into lists of at most `size` items."""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ndjson_chunks(records, batch_size):
+    """Yield newline-delimited JSON, one chunk per batch of records."""
+    for batch in batches(records, batch_size):
+        yield ''.join(json.dumps(record, default=str) + '\n'
+                      for record in batch)
+
+
+def csv_chunks(records, batch_size):
+    """Yield CSV with a header taken from the first record's keys."""
+    buffer = io.StringIO()
+    writer = None
+    for batch in batches(records, batch_size):
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(batch[0]))
+            writer.writeheader()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_export(query, export_format, batch_size=EXPORT_BATCH_SIZE):
+    """Stream every row of `query` as NDJSON or CSV.
+
+    Rows are read `batch_size` at a time through a server-side cursor
+    (yield_per), so memory stays flat however large the table is, and the
+    first chunk is sent before the last row has been read.
+    """
+    rows = query.yield_per(batch_size)
+    records = (row.format() for row in rows)
+
+    if export_format == 'csv':
+        chunks = csv_chunks(records, batch_size)
+    else:
+        chunks = ndjson_chunks(records, batch_size)
+
+    return Response(stream_with_context(chunks),
+                    mimetype=EXPORT_FORMATS[export_format])
@@ -0,0 +1,55 @@
+from flask import request, abort
+
+
+def get_fields(model):
+    """Read the `fields` query parameter as a list of column names.
+
+    Returns None when every field was asked for. The id is always included
+    so rows can still be paginated, and unknown names abort with a 400.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+
+    names = list(dict.fromkeys(
+        name.strip() for name in fields.split(',') if name.strip()))
+    if not names or any(name not in model.public_fields for name in names):
+        abort(400)
+
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return names
+
+
+def get_includes(model):
+    """Read the `include` query parameter as a tuple of relation names.
+
+    Unknown names abort with a 400.
+    """
+    include = request.args.get('include')
+    if not include:
+        return ()
+
+    names = tuple(dict.fromkeys(
+        name.strip() for name in include.split(',') if name.strip()))
+    if any(name not in model.related_tables for name in names):
+        abort(400)
+    return names
+
+
+def related_tables(model):
+    """Return the tables the current request's response is built from."""
+    tables = [model.__tablename__]
+    for name in get_includes(model):
+        tables.extend(model.related_tables[name])
+    return list(dict.fromkeys(tables))
+
+
+def serialize(row, fields, includes=()):
+    """Format a full model object or a row returned by select_fields.
+
+    Dates in select_fields rows are left for json_response to encode.
+    """
+    if fields is None:
+        return row.format(includes)
+    return dict(zip(fields, row))
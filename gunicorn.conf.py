@@ -0,0 +1,67 @@
+"""Gunicorn settings, picked up automatically from the project directory.
+
+Every setting can be overridden from the environment:
+
+    GUNICORN_WORKER_CLASS  gthread (default), sync, gevent or eventlet
+    WEB_CONCURRENCY        worker processes (default 2 x CPUs + 1)
+    GUNICORN_THREADS       threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS
+                           concurrent requests per gevent/eventlet worker
+    GUNICORN_KEEPALIVE     seconds to hold an idle keep-alive connection
+    GUNICORN_MAX_REQUESTS  recycle a worker after this many requests
+    GUNICORN_MAX_REQUESTS_JITTER
+                           random extra requests, so workers don't all
+                           restart together
+    GUNICORN_TIMEOUT       seconds before a silent worker is killed
+    GUNICORN_PRELOAD       import the app once in the master
+"""
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+ASYNC_WORKERS = ('gevent', 'eventlet')
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('GUNICORN_THREADS', 4) if worker_class == 'gthread' else 1
+worker_connections = env_int('GUNICORN_WORKER_CONNECTIONS', 1000)
+
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# create_app does no I/O, so the app can be imported once in the master and
+# shared by the forked workers. Async workers monkey-patch after the fork,
+# so the locks the app creates at import would be unpatched thread locks:
+# they load the app in each worker instead.
+preload_app = env_bool('GUNICORN_PRELOAD', worker_class not in ASYNC_WORKERS)
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+
+
+def post_fork(server, worker):
+    """Make psycopg2 cooperative under the async workers.
+
+    The gevent and eventlet workers patch the standard library, but
+    psycopg2 talks to the socket in C, so without psycogreen every query
+    would block all of a worker's requests.
+    """
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    elif worker_class == 'eventlet':
+        from psycogreen.eventlet import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,77 @@
+import json
+from datetime import date
+from decimal import Decimal
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    """Encode the values neither provider handles natively."""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class StdlibJSONProvider:
+    """Encodes with the standard library json module."""
+
+    name = 'json'
+
+    def dumps(self, obj, sort_keys=False):
+        return json.dumps(obj, default=default, sort_keys=sort_keys,
+                          ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonJSONProvider:
+    """Encodes with orjson, several times faster for large lists."""
+
+    name = 'orjson'
+
+    def dumps(self, obj, sort_keys=False):
+        return orjson.dumps(
+            obj, default=default,
+            option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+
+
+JSON_PROVIDERS = {
+    StdlibJSONProvider.name: StdlibJSONProvider,
+    OrjsonJSONProvider.name: OrjsonJSONProvider
+}
+
+
+def create_provider(name='auto'):
+    """Return the provider named by JSON_PROVIDER.
+
+    'auto' uses orjson when it is installed and the standard library
+    otherwise.
+    """
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in JSON_PROVIDERS:
+        raise ValueError('Unknown JSON provider {!r}'.format(name))
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER is orjson but it is not installed.')
+    return JSON_PROVIDERS[name]()
+
+
+def setup_json(app):
+    app.extensions['json_provider'] = create_provider(
+        app.config.get('JSON_PROVIDER', 'auto'))
+
+
+def json_response(obj, status=200):
+    """Like jsonify, but encoded with the app's JSON provider.
+
+    Dates are written in ISO format.
+    """
+    provider = current_app.extensions['json_provider']
+    body = provider.dumps(obj, sort_keys=current_app.config['JSON_SORT_KEYS'])
+    return current_app.response_class(body, status=status,
+                                      mimetype='application/json')
@@ -1,10 +1,9 @@
 from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import MigrateCommand
 
-from app import app
-from models import db
+from app import create_app
 
-migrate = Migrate(app, db)
+app = create_app()
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
@@ -0,0 +1,182 @@
+import bisect
+import logging
+import threading
+import time
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.local import LocalProxy
+
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LABELS = ('endpoint', 'method', 'status')
+
+
+class Histogram:
+    """A labelled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, description, buckets, label_names):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label_names = label_names
+
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = sorted((labels, list(counts), total)
+                            for labels, (counts, total)
+                            in self._series.items())
+
+        lines = ['# HELP {} {}'.format(self.name, self.description),
+                 '# TYPE {} histogram'.format(self.name)]
+        for labels, counts, total in series:
+            label_text = ','.join(
+                '{}="{}"'.format(name, escape_label(value))
+                for name, value in zip(self.label_names, labels))
+
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    self.name, label_text, bound, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(
+                self.name, label_text, total))
+            lines.append('{}_count{{{}}} {}'.format(
+                self.name, label_text, cumulative))
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    start = conn.info['query_start_time'].pop()
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements.append((time.perf_counter() - start, statement))
+
+
+class RequestMetrics:
+    """Per-endpoint latency, auth time, SQL and response size histograms.
+
+    Series are labelled by endpoint, method and status. Every statement on
+    any engine is timed, so the primary and the replicas are both counted.
+    Requests slower than `slow_seconds` are logged with their slowest
+    statements. Each worker process keeps its own numbers.
+    """
+
+    def __init__(self):
+        self.duration = Histogram(
+            'http_request_duration_seconds',
+            'Wall time spent handling the request.',
+            LATENCY_BUCKETS, REQUEST_LABELS)
+        self.auth = Histogram(
+            'http_request_auth_seconds',
+            'Time spent verifying the bearer token and permissions.',
+            LATENCY_BUCKETS, REQUEST_LABELS)
+        self.sql_queries = Histogram(
+            'http_request_sql_queries',
+            'SQL statements executed by the request.',
+            QUERY_COUNT_BUCKETS, REQUEST_LABELS)
+        self.sql_seconds = Histogram(
+            'http_request_sql_seconds',
+            'Time spent executing SQL statements.',
+            LATENCY_BUCKETS, REQUEST_LABELS)
+        self.response_size = Histogram(
+            'http_response_size_bytes',
+            'Size of the response body. Streamed responses are not counted.',
+            SIZE_BUCKETS, REQUEST_LABELS)
+
+        self.slow_seconds = 1.0
+        self.slow_statements = 3
+
+    def histograms(self):
+        return (self.duration, self.auth, self.sql_queries, self.sql_seconds,
+                self.response_size)
+
+    def init_app(self, app):
+        app.extensions['request_metrics'] = self
+        self.slow_seconds = app.config.get('SLOW_REQUEST_SECONDS', 1.0)
+        self.slow_statements = app.config.get('SLOW_REQUEST_STATEMENTS', 3)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        g.request_start = time.perf_counter()
+        g.sql_statements = []
+
+    def finish_request(self, response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+
+        duration = time.perf_counter() - start
+        statements = g.get('sql_statements', [])
+        sql_seconds = sum(seconds for seconds, _ in statements)
+        labels = (request.endpoint or 'unmatched', request.method,
+                  str(response.status_code))
+
+        self.duration.observe(labels, duration)
+        self.auth.observe(labels, g.get('auth_seconds', 0.0))
+        self.sql_queries.observe(labels, len(statements))
+        self.sql_seconds.observe(labels, sql_seconds)
+        if not response.is_streamed:
+            self.response_size.observe(labels, len(response.get_data()))
+
+        if self.slow_seconds is not None and duration >= self.slow_seconds:
+            self.log_slow_request(duration, statements, sql_seconds)
+        return response
+
+    def log_slow_request(self, duration, statements, sql_seconds):
+        slowest = sorted(statements, key=lambda item: item[0],
+                         reverse=True)[:self.slow_statements]
+        logger.warning(
+            'Slow request %s %s took %.3fs, %d SQL statements in %.3fs.%s',
+            request.method, request.full_path.rstrip('?'), duration,
+            len(statements), sql_seconds, ''.join(
+                '\n  [{:.3f}s] {}'.format(seconds, ' '.join(statement.split()))
+                for seconds, statement in slowest))
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms():
+            lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+# The current app's metrics. Each app gets its own in create_app.
+request_metrics = LocalProxy(
+    lambda: current_app.extensions['request_metrics'])
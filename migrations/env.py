@@ -5,6 +5,7 @@ from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import Column
 
 from alembic import context
 
@@ -54,6 +55,16 @@ def run_migrations_offline():
         context.run_migrations()
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Indexes on expressions such as lower(name) can't be reflected, so
+    # autogenerate would add them again every time. They are written by
+    # hand in the migrations instead (see 8d4e2b6a1c57).
+    if type_ == 'index' and not reflected:
+        return all(isinstance(expression, Column)
+                   for expression in object.expressions)
+    return True
+
+
 def run_migrations_online():
     """Run migrations in 'online' mode.
 
@@ -83,6 +94,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,51 @@
+"""add casting association between actors and movies
+
+Revision ID: 5b1f0c7d2a93
+Revises: e9bbac9d6eeb
+Create Date: 2026-10-17 11:02:17.904512
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7d2a93'
+down_revision = 'e9bbac9d6eeb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'casting',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.Column('billing_order', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['actor_id'], ['actor.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['movie_id'], ['movie.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    op.create_index(op.f('ix_casting_actor_id'), 'casting', ['actor_id'],
+                    unique=False)
+
+    table_version = sa.table(
+        'table_version',
+        sa.column('table_name', sa.String()),
+        sa.column('version', sa.Integer()),
+        sa.column('updated_at', sa.DateTime())
+    )
+    op.bulk_insert(table_version, [
+        {'table_name': 'casting', 'version': 1,
+         'updated_at': datetime.utcnow()}
+    ])
+
+
+def downgrade():
+    op.execute("DELETE FROM table_version WHERE table_name = 'casting'")
+    op.drop_index(op.f('ix_casting_actor_id'), table_name='casting')
+    op.drop_table('casting')
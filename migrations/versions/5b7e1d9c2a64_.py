@@ -0,0 +1,49 @@
+"""add change feed versions and tombstones
+
+Revision ID: 5b7e1d9c2a64
+Revises: c3a9f41e7b20
+Create Date: 2026-10-17 16:05:12.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e1d9c2a64'
+down_revision = 'c3a9f41e7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows start at version 0, so the first sync reads them all.
+    for table_name in ('actor', 'movie'):
+        op.add_column(table_name, sa.Column(
+            'version', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table_name, sa.Column(
+            'updated_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_version_id'.format(table_name), table_name,
+                        ['version', 'id'], unique=False)
+
+    op.create_table(
+        'tombstone',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name', 'row_id')
+    )
+    op.create_index('ix_tombstone_table_name_version_row_id', 'tombstone',
+                    ['table_name', 'version', 'row_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tombstone_table_name_version_row_id',
+                  table_name='tombstone')
+    op.drop_table('tombstone')
+    for table_name in ('movie', 'actor'):
+        op.drop_index('ix_{}_version_id'.format(table_name),
+                      table_name=table_name)
+        op.drop_column(table_name, 'updated_at')
+        op.drop_column(table_name, 'version')
@@ -0,0 +1,47 @@
+"""add search indexes on actor and movie
+
+Revision ID: 8d4e2b6a1c57
+Revises: 5b1f0c7d2a93
+Create Date: 2026-10-17 12:40:05.117384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4e2b6a1c57'
+down_revision = '5b1f0c7d2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_actor_age'), 'actor', ['age'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # text_pattern_ops lets lower(col) LIKE 'abc%' use the btree in any
+        # locale, and the trigram indexes serve LIKE '%abc%'.
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_actor_name_lower '
+                   'ON actor (lower(name) text_pattern_ops)')
+        op.execute('CREATE INDEX ix_actor_name_trgm '
+                   'ON actor USING gin (lower(name) gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_movie_title_lower '
+                   'ON movie (lower(title) text_pattern_ops)')
+        op.execute('CREATE INDEX ix_movie_title_trgm '
+                   'ON movie USING gin (lower(title) gin_trgm_ops)')
+    else:
+        op.create_index('ix_actor_name_lower', 'actor',
+                        [sa.text('lower(name)')])
+        op.create_index('ix_movie_title_lower', 'movie',
+                        [sa.text('lower(title)')])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_movie_title_trgm', table_name='movie')
+        op.drop_index('ix_actor_name_trgm', table_name='actor')
+    op.drop_index('ix_movie_title_lower', table_name='movie')
+    op.drop_index('ix_actor_name_lower', table_name='actor')
+    op.drop_index(op.f('ix_actor_age'), table_name='actor')
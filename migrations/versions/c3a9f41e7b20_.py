@@ -0,0 +1,76 @@
+"""add typed released_on date to movie
+
+Revision ID: c3a9f41e7b20
+Revises: 8d4e2b6a1c57
+Create Date: 2026-10-17 14:21:36.550918
+
+"""
+from datetime import date, datetime
+from alembic import op
+from dateutil import parser as date_parser
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a9f41e7b20'
+down_revision = '8d4e2b6a1c57'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+movie = sa.table(
+    'movie',
+    sa.column('id', sa.Integer()),
+    sa.column('release_date', sa.String()),
+    sa.column('released_on', sa.Date())
+)
+
+
+def parse_release_date(value):
+    # Mirrors models.parse_release_date; migrations don't import the app.
+    if not value or not value.strip():
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return date_parser.parse(value, default=datetime(1900, 1, 1)).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def upgrade():
+    op.add_column('movie', sa.Column('released_on', sa.Date(), nullable=True))
+
+    # Backfill in keyset batches so the table is never read in one go.
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select([movie.c.id, movie.c.release_date])
+            .where(movie.c.id > last_id)
+            .order_by(movie.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = [{'movie_id': id, 'released_on': parse_release_date(value)}
+                   for id, value in rows]
+        bind.execute(
+            movie.update()
+            .where(movie.c.id == sa.bindparam('movie_id'))
+            .values(released_on=sa.bindparam('released_on')),
+            updates
+        )
+        last_id = rows[-1][0]
+
+    op.create_index('ix_movie_released_on_id', 'movie',
+                    ['released_on', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_movie_released_on_id', table_name='movie')
+    op.drop_column('movie', 'released_on')
@@ -0,0 +1,36 @@
+"""add table_version write counters
+
+Revision ID: e9bbac9d6eeb
+Revises: 29335e064d25
+Create Date: 2026-10-17 09:12:44.318220
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9bbac9d6eeb'
+down_revision = '29335e064d25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table(
+        'table_version',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(table_version, [
+        {'table_name': 'actor', 'version': 1, 'updated_at': now},
+        {'table_name': 'movie', 'version': 1, 'updated_at': now}
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
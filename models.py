@@ -1,83 +1,576 @@
-import os
-from flask_sqlalchemy import SQLAlchemy
+from collections import defaultdict
+from functools import partial
+from datetime import date, datetime
+from dateutil import parser as date_parser
+import sqlite3
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.expression import Insert, Delete
+from sqlalchemy.orm import selectinload, validates
+from cache import response_cache
+from pool import engine_options
+from replicas import ReplicaRouter, RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
-database_path = os.environ['DATABASE_URL']
 
-# ----------------------------------------------------------------#
-# For Testing Only:
-# Please comment out the above database path and use the one below.
-#
-# database_path = os.environ['TEST_DATABASE_URL'])
-# ----------------------------------------------------------------#
+def setup_db(app, database_path=None):
+    """Bind the database to `app` without connecting to it.
 
+    The schema is created by the migrations (`flask db upgrade`), not here,
+    so building an app never runs DDL and is safe under `gunicorn --preload`.
+    """
+    if database_path is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_path
+    database_path = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if not database_path:
+        raise RuntimeError('DATABASE_URL is not set.')
 
-def setup_db(app, database_path=database_path):
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_path
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        database_path, app.config)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    ReplicaRouter().init_app(
+        app, app.config.get('DATABASE_REPLICA_URLS', ()),
+        sticky_seconds=app.config.get('REPLICA_STICKY_SECONDS', 5),
+        engine_options=partial(engine_options, config=app.config))
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Turn on foreign keys for SQLite, which ignores them by default.
+
+    Without this, deleting an actor or movie leaves its casting rows behind
+    instead of cascading, as PostgreSQL does.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# Databases whose writes read back their rows with ... RETURNING.
+RETURNING_DIALECTS = ('postgresql',)
+
+
+class TableVersion(db.Model):
+    """A write counter per table, used to build cheap ETags."""
+
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+
+def bump_version(table_name):
+    """Record a write to `table_name` as part of the current transaction.
+
+    Returns the table's new version and the time of the write. The UPDATE
+    locks the table's counter row until commit, so writers to one table
+    queue up here and versions are handed out in commit order. Row writes
+    call this first, which keeps that lock order the same everywhere.
+    """
+    now = datetime.utcnow()
+    table = TableVersion.__table__
+    statement = table.update() \
+        .where(table.c.table_name == table_name) \
+        .values(version=table.c.version + 1, updated_at=now)
+
+    if db.session.get_bind().dialect.name in RETURNING_DIALECTS:
+        version = db.session.execute(
+            statement.returning(table.c.version)).scalar()
+    elif db.session.execute(statement).rowcount:
+        version = db.session.execute(select([table.c.version]).where(
+            table.c.table_name == table_name)).scalar()
+    else:
+        version = None
+
+    if version is None:
+        version = 1
+        db.session.add(TableVersion(
+            table_name=table_name, version=version, updated_at=now))
+    return version, now
+
+
+class Tombstone(db.Model):
+    """Marks a deleted actor or movie, for the change feed."""
+
+    __tablename__ = 'tombstone'
+    table_name = db.Column(db.String(), primary_key=True)
+    row_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.Index('ix_tombstone_table_name_version_row_id',
+                 table_name, version, row_id),
+    )
+
+
+def stamp(values, version, now):
+    """Add the change feed columns for a write at `version` to `values`."""
+    return dict(values, version=version, updated_at=now)
+
+
+def record_deletes(model, ids, version, now):
+    """Leave a tombstone for each deleted row.
+
+    Ids can be reused (SQLite hands out the highest id again once it is
+    deleted), so a row id may already have a tombstone from an earlier
+    delete. That one is replaced, moving it to this delete's version.
+    """
+    table = Tombstone.__table__
+    rows = [{
+        'table_name': model.__tablename__,
+        'row_id': id,
+        'version': version,
+        'deleted_at': now
+    } for id in ids]
+
+    if db.session.get_bind().dialect.name in RETURNING_DIALECTS:
+        statement = postgresql.insert(table).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.table_name, table.c.row_id],
+            set_={'version': statement.excluded.version,
+                  'deleted_at': statement.excluded.deleted_at}))
+    else:
+        db.session.execute(table.delete()
+                           .where(table.c.table_name == model.__tablename__)
+                           .where(table.c.row_id.in_(ids)))
+        db.session.execute(table.insert().values(rows))
+
+
+def get_versions(table_names):
+    """Return {table_name: (version, updated_at)} for the given tables."""
+    rows = db.session.query(
+        TableVersion.table_name, TableVersion.version,
+        TableVersion.updated_at
+    ).filter(TableVersion.table_name.in_(table_names)).all()
+
+    versions = {name: (0, None) for name in table_names}
+    versions.update((name, (version, updated_at))
+                    for name, version, updated_at in rows)
+    return versions
+
+
+def parse_release_date(value):
+    """Parse an ISO or free-form release date, returning None if unparsable.
+
+    Missing parts default to the start of the period, so "2013" is read as
+    2013-01-01 and "November 2013" as 2013-11-01.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return date_parser.parse(value, default=datetime(1900, 1, 1)).date()
+    except (ValueError, OverflowError):
+        return None
+
+
+def insert_many(model, rows, batch_size=1000):
+    """Insert a list of column dicts with multi-row INSERTs.
+
+    Every batch runs in the same transaction, so either all rows are stored
+    or none are.
+    """
+    if not rows:
+        return
+
+    version, now = bump_version(model.__tablename__)
+    rows = [stamp(model.prepare(row), version, now) for row in rows]
+    table = model.__table__
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(
+            table.insert().values(rows[start:start + batch_size]))
+
+    db.session.commit()
+    response_cache.invalidate(model.__tablename__)
+
+
+def lock_existing_ids(model, ids):
+    """Return the subset of `ids` that exist, locking those rows."""
+    rows = db.session.query(model.id).filter(model.id.in_(ids)) \
+        .with_for_update().all()
+    return {id for id, in rows}
+
+
+def update_many(model, patches):
+    """Apply {id: {column: value}} patches in one transaction.
+
+    Ids that share the same changes are updated together with a single
+    UPDATE ... WHERE id IN (...). Returns the ids that were updated.
+    """
+    version, now = bump_version(model.__tablename__)
+    existing = lock_existing_ids(model, list(patches))
+    if not existing:
+        db.session.rollback()
+        return []
+
+    groups = defaultdict(list)
+    for id in existing:
+        groups[tuple(sorted(patches[id].items()))].append(id)
+
+    for changes, ids in groups.items():
+        db.session.query(model).filter(model.id.in_(ids)) \
+            .update(stamp(model.prepare(dict(changes)), version, now),
+                    synchronize_session=False)
+
+    db.session.commit()
+    for id in existing:
+        response_cache.invalidate(model.__tablename__, id)
+    return sorted(existing)
+
+
+def delete_many(model, ids):
+    """Delete rows by id with one DELETE ... WHERE id IN (...).
+
+    Returns the ids that were deleted.
+    """
+    version, now = bump_version(model.__tablename__)
+    existing = lock_existing_ids(model, ids)
+    if not existing:
+        db.session.rollback()
+        return []
+
+    db.session.query(model).filter(model.id.in_(existing)) \
+        .delete(synchronize_session=False)
+    record_deletes(model, sorted(existing), version, now)
+    db.session.commit()
+    for id in existing:
+        response_cache.invalidate(model.__tablename__, id)
+    return sorted(existing)
+
+
+def write_row(model, statement, id=None):
+    """Run a single-row INSERT, UPDATE or DELETE and return the row.
+
+    Where the database supports RETURNING the row comes back from the write
+    itself, so the response is built without reading it again. Elsewhere
+    (SQLite) it is read with one extra SELECT: after an INSERT or UPDATE,
+    and before a DELETE. Returns the row as a {column: value} dict, or
+    None if no row matched. The caller commits.
+    """
+    table = model.__table__
+    columns = [table.c[name] for name in model.public_fields]
+
+    if db.session.get_bind().dialect.name in RETURNING_DIALECTS:
+        row = db.session.execute(statement.returning(*columns)).first()
+    else:
+        def read(id):
+            return db.session.execute(
+                select(columns).where(table.c.id == id)).first()
+
+        if isinstance(statement, Insert):
+            row = read(db.session.execute(statement)
+                       .inserted_primary_key[0])
+        elif isinstance(statement, Delete):
+            row = read(id)
+            if row is not None:
+                db.session.execute(statement)
+        elif db.session.execute(statement).rowcount:
+            row = read(id)
+        else:
+            row = None
+    return row
+
+
+def finish_write(model, row):
+    """Commit a write_row, or roll it back if no row matched."""
+    if row is None:
+        db.session.rollback()
+        return None
+
+    db.session.commit()
+    response_cache.invalidate(model.__tablename__, row['id'])
+    return dict(row)
+
+
+def insert_row(model, values):
+    """Insert one row from a column dict and return it."""
+    version, now = bump_version(model.__tablename__)
+    return finish_write(model, write_row(model, model.__table__.insert()
+                        .values(stamp(model.prepare(values), version, now))))
+
+
+def update_row(model, id, values):
+    """Apply a column dict to one row and return it, or None if missing."""
+    table = model.__table__
+    if not values:
+        row = db.session.execute(select(
+            [table.c[name] for name in model.public_fields]
+        ).where(table.c.id == id)).first()
+        return dict(row) if row is not None else None
+
+    version, now = bump_version(model.__tablename__)
+    return finish_write(model, write_row(
+        model, table.update().where(table.c.id == id)
+        .values(stamp(model.prepare(values), version, now)), id))
+
+
+def delete_row(model, id):
+    """Delete one row and return it as it was, or None if missing."""
+    table = model.__table__
+    version, now = bump_version(model.__tablename__)
+    row = write_row(model, table.delete().where(table.c.id == id), id)
+    if row is not None:
+        record_deletes(model, [id], version, now)
+    return finish_write(model, row)
+
+
+def get_many(model, ids, fields=None, includes=()):
+    """Fetch rows by id with one SELECT ... WHERE id IN (...).
+
+    Returns the rows in the order of `ids` and the ids that don't exist.
+    With `includes` the rows are full objects with those relations loaded,
+    otherwise they are Core result tuples of `fields`.
+    """
+    if includes:
+        rows = model.with_includes(model.query, includes) \
+            .filter(model.id.in_(ids)).all()
+    else:
+        query = select_fields(model, fields).filter(model.id.in_(ids))
+        rows = db.session.execute(query.statement).fetchall()
+
+    found = {row.id: row for row in rows}
+    return [found[id] for id in ids if id in found], \
+        [id for id in ids if id not in found]
+
+
+def select_fields(model, fields):
+    """Query only the named columns of `model`.
+
+    Rows come back as lightweight named tuples instead of full objects, so
+    columns that weren't asked for are never read from the database.
+    """
+    return db.session.query(*[getattr(model, name) for name in fields])
 
 
 class Actor(db.Model):
     """A DB Model that defines an Actor"""
 
     __tablename__ = 'actor'
+    public_fields = ('id', 'name', 'age', 'gender')
+    field_types = {'name': str, 'age': int, 'gender': str}
+    related_tables = {'movies': ('casting', 'movie')}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String())
-    age = db.Column(db.Integer)
+    age = db.Column(db.Integer, index=True)
     gender = db.Column(db.String())
+    version = db.Column(db.Integer, nullable=False, default=0,
+                        server_default='0')
+    updated_at = db.Column(db.DateTime)
+    movies = db.relationship('Casting', back_populates='actor',
+                             order_by='Casting.movie_id',
+                             passive_deletes=True)
+    # The same indexes migration 8d4e2b6a1c57 builds. On PostgreSQL
+    # text_pattern_ops serves prefix LIKE in any locale and the trigram
+    # index serves LIKE '%abc%'.
+    __table_args__ = (
+        db.Index('ix_actor_name_lower', db.func.lower(name).label('name'),
+                 postgresql_ops={'name': 'text_pattern_ops'}),
+        db.Index('ix_actor_name_trgm', db.func.lower(name).label('name'),
+                 postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_actor_version_id', version, id)
+    )
 
     def __repr__(self):
         return '<Actor {} {}>'.format(self.name, self.age, self.gender)
 
     def insert(self):
+        self.version, self.updated_at = bump_version(self.__tablename__)
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__)
 
     def update(self):
+        self.version, self.updated_at = bump_version(self.__tablename__)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__, self.id)
 
     def delete(self):
+        version, now = bump_version(self.__tablename__)
         db.session.delete(self)
+        record_deletes(type(self), [self.id], version, now)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__, self.id)
 
-    def format(self):
-        return {
+    @staticmethod
+    def prepare(values):
+        """Fill in derived columns for a bulk insert or update."""
+        return values
+
+    @staticmethod
+    def with_includes(query, includes):
+        """Load the related rows in `includes` with one query per page."""
+        if 'movies' in includes:
+            query = query.options(
+                selectinload(Actor.movies).joinedload(Casting.movie))
+        return query
+
+    def format(self, includes=()):
+        actor = {
             'id': self.id,
             'name': self.name,
             'age': self.age,
             'gender': self.gender
         }
+        if 'movies' in includes:
+            actor['movies'] = [casting.format_movie()
+                               for casting in self.movies]
+        return actor
 
 
 class Movie(db.Model):
     """A DB Model that defines a Movie"""
 
     __tablename__ = 'movie'
+    public_fields = ('id', 'title', 'release_date', 'released_on')
+    field_types = {'title': str, 'release_date': str}
+    related_tables = {'cast': ('casting', 'actor')}
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String())
     release_date = db.Column(db.String())
+    released_on = db.Column(db.Date)
+    version = db.Column(db.Integer, nullable=False, default=0,
+                        server_default='0')
+    updated_at = db.Column(db.DateTime)
+    cast = db.relationship('Casting', back_populates='movie',
+                           order_by='Casting.billing_order',
+                           passive_deletes=True)
+    # Built by migration 8d4e2b6a1c57, like the Actor name indexes.
+    __table_args__ = (
+        db.Index('ix_movie_title_lower', db.func.lower(title).label('title'),
+                 postgresql_ops={'title': 'text_pattern_ops'}),
+        db.Index('ix_movie_title_trgm', db.func.lower(title).label('title'),
+                 postgresql_using='gin',
+                 postgresql_ops={'title': 'gin_trgm_ops'}),
+        db.Index('ix_movie_released_on_id', released_on, id),
+        db.Index('ix_movie_version_id', version, id)
+    )
 
     def __repr__(self):
         return '<Movie {} {}>'.format(self.title, self.release_date)
 
     def insert(self):
+        self.version, self.updated_at = bump_version(self.__tablename__)
         db.session.add(self)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__)
 
     def update(self):
+        self.version, self.updated_at = bump_version(self.__tablename__)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__, self.id)
 
     def delete(self):
+        version, now = bump_version(self.__tablename__)
         db.session.delete(self)
+        record_deletes(type(self), [self.id], version, now)
         db.session.commit()
+        response_cache.invalidate(self.__tablename__, self.id)
 
-    def format(self):
-        return {
+    @validates('release_date')
+    def validate_release_date(self, key, value):
+        self.released_on = parse_release_date(value)
+        return value
+
+    @staticmethod
+    def prepare(values):
+        """Fill in derived columns for a bulk insert or update."""
+        if 'release_date' in values:
+            values = dict(values, released_on=parse_release_date(
+                values['release_date']))
+        return values
+
+    @staticmethod
+    def with_includes(query, includes):
+        """Load the related rows in `includes` with one query per page."""
+        if 'cast' in includes:
+            query = query.options(
+                selectinload(Movie.cast).joinedload(Casting.actor))
+        return query
+
+    def format(self, includes=()):
+        movie = {
             'id': self.id,
             'title': self.title,
-            'release_date': self.release_date
+            'release_date': self.release_date,
+            'released_on': self.released_on.isoformat()
+            if self.released_on else None
+        }
+        if 'cast' in includes:
+            movie['cast'] = [casting.format_actor() for casting in self.cast]
+        return movie
+
+
+class Casting(db.Model):
+    """A DB Model that casts an Actor in a Movie"""
+
+    __tablename__ = 'casting'
+    movie_id = db.Column(db.Integer,
+                         db.ForeignKey('movie.id', ondelete='CASCADE'),
+                         primary_key=True)
+    actor_id = db.Column(db.Integer,
+                         db.ForeignKey('actor.id', ondelete='CASCADE'),
+                         primary_key=True, index=True)
+    role = db.Column(db.String())
+    billing_order = db.Column(db.Integer)
+    movie = db.relationship('Movie', back_populates='cast')
+    actor = db.relationship('Actor', back_populates='movies')
+
+    def __repr__(self):
+        return '<Casting {} {} {}>'.format(
+            self.movie_id, self.actor_id, self.role)
+
+    def insert(self):
+        db.session.add(self)
+        bump_version(self.__tablename__)
+        db.session.commit()
+        self.invalidate()
+
+    def update(self):
+        bump_version(self.__tablename__)
+        db.session.commit()
+        self.invalidate()
+
+    def delete(self):
+        db.session.delete(self)
+        bump_version(self.__tablename__)
+        db.session.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        response_cache.invalidate(self.__tablename__)
+        response_cache.invalidate('movie', self.movie_id)
+        response_cache.invalidate('actor', self.actor_id)
+
+    def format(self):
+        return {
+            'movie_id': self.movie_id,
+            'actor_id': self.actor_id,
+            'role': self.role,
+            'billing_order': self.billing_order
+        }
+
+    def format_actor(self):
+        return {
+            'actor_id': self.actor_id,
+            'name': self.actor.name,
+            'role': self.role,
+            'billing_order': self.billing_order
+        }
+
+    def format_movie(self):
+        return {
+            'movie_id': self.movie_id,
+            'title': self.movie.title,
+            'role': self.role,
+            'billing_order': self.billing_order
         }
@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import date
+from flask import request, abort
+from sqlalchemy import tuple_
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """Build the opaque cursor that points just past the row `values`."""
+    values = [value.isoformat() if isinstance(value, date) else value
+              for value in values]
+    raw = json.dumps({'after': values}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the sort key values a cursor points past, or abort with 400."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))['after']
+    except (ValueError, TypeError, KeyError):
+        abort(400)
+
+    if not isinstance(values, list) or not values:
+        abort(400)
+    return values
+
+
+def get_page_args(columns):
+    """Read `cursor` and `limit` from the query string.
+
+    The cursor is decoded into values for the sort `columns` (a column or a
+    tuple of them). The limit defaults to DEFAULT_PAGE_SIZE and is capped at
+    MAX_PAGE_SIZE.
+    """
+    if not isinstance(columns, tuple):
+        columns = (columns,)
+
+    cursor = request.args.get('cursor')
+    after = cursor_values(columns, decode_cursor(cursor)) if cursor else None
+    return after, get_limit()
+
+
+def get_limit():
+    """Read `limit` from the query string, capped at MAX_PAGE_SIZE.
+
+    A limit that isn't a positive integer is a 400, not the default.
+    """
+    limit = request.args.get('limit')
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        abort(400)
+    if limit < 1:
+        abort(400)
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def cursor_values(columns, after):
+    """Convert decoded cursor values back to the columns' Python types."""
+    if len(after) != len(columns):
+        abort(400)
+
+    values = []
+    for column, value in zip(columns, after):
+        try:
+            if column.type.python_type is date:
+                value = date.fromisoformat(value)
+            elif not isinstance(value, column.type.python_type):
+                abort(400)
+        except (TypeError, ValueError):
+            abort(400)
+        values.append(value)
+    return values
+
+
+def paginate(query, columns, after, limit, descending=False, core=False):
+    """Return one keyset page of `query` and the cursor for the next one.
+
+    Rows are ordered by `columns` (a column, or a tuple ending in the
+    primary key) and only rows past the `after` values from get_page_args
+    are read, so every page costs the same no matter how deep into the
+    table it is. The cursor is None on the last page.
+
+    With core=True, for select_fields queries, the SELECT runs through
+    SQLAlchemy Core and the rows are plain result tuples. This skips the
+    ORM's per-row processing.
+    """
+    if not isinstance(columns, tuple):
+        columns = (columns,)
+
+    if descending:
+        query = query.order_by(*[column.desc() for column in columns])
+    else:
+        query = query.order_by(*columns)
+
+    if after is not None:
+        if len(columns) == 1:
+            key, values = columns[0], after[0]
+        else:
+            key, values = tuple_(*columns), tuple_(*after)
+        query = query.filter(key < values if descending else key > values)
+
+    query = query.limit(limit + 1)
+    if core:
+        rows = query.session.execute(query.statement).fetchall()
+    else:
+        rows = query.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(
+            [getattr(rows[-1], column.key) for column in columns])
+
+    return rows, next_cursor
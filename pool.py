@@ -0,0 +1,94 @@
+import bisect
+import threading
+import time
+from sqlalchemy.pool import QueuePool
+
+
+# Upper bounds, in seconds, of the checkout wait time histogram buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class WaitHistogram:
+    """A cumulative histogram of how long checkouts waited for a connection."""
+
+    def __init__(self, buckets=WAIT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.total
+
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'count': cumulative, 'sum': total}
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records how long each checkout waited."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_times = WaitHistogram()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_times = self.wait_times
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_times.observe(time.perf_counter() - start)
+
+
+def engine_options(database_path, config=None):
+    """Build the SQLAlchemy engine options from the app's `config`.
+
+    SQLite doesn't use a QueuePool, so only pre-ping applies to it.
+    """
+    config = config or {}
+    options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+    if database_path.startswith('sqlite'):
+        return options
+
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800)
+    })
+    return options
+
+
+def pool_stats(engine):
+    """Return live connection pool numbers for an engine."""
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool._timeout
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats['wait_seconds'] = pool.wait_times.snapshot()
+    return stats
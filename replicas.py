@@ -0,0 +1,144 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm
+from werkzeug.local import LocalProxy
+
+
+STICKY_COOKIE = 'read_primary_until'
+
+
+class ReplicaRouter:
+    """Sends read-only requests to read replicas, round-robin.
+
+    A client that has just written is kept on the primary for
+    `sticky_seconds` so it always reads its own writes. Clients are tracked
+    by token subject in this process and, across workers, by a short-lived
+    cookie set on the write response.
+    """
+
+    def __init__(self):
+        self.urls = ()
+        self.sticky_seconds = 5
+        self.engine_options = None
+
+        self._engines = None
+        self._counter = itertools.count()
+        self._recent_writers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, urls, sticky_seconds=5, engine_options=None):
+        self.urls = tuple(urls)
+        self.sticky_seconds = sticky_seconds
+        self.engine_options = engine_options
+        self._engines = None
+        app.extensions['replica_router'] = self
+        app.after_request(self.set_sticky_cookie)
+
+    def engines(self):
+        # Created on first use so each forked worker gets its own pools.
+        if self._engines is None:
+            with self._lock:
+                if self._engines is None:
+                    options = self.engine_options or (lambda url: {})
+                    self._engines = [create_engine(url, **options(url))
+                                     for url in self.urls]
+        return self._engines
+
+    def client_id(self):
+        user = g.get('current_user')
+        return user.get('sub') if user else None
+
+    def is_sticky(self):
+        """Whether the current client wrote within the sticky window."""
+        now = time.time()
+        try:
+            if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        return self._recent_writers.get(self.client_id(), 0) > now
+
+    def engine_for_request(self):
+        """Return the replica engine for this request, or None for primary."""
+        if not self.urls or not has_request_context() or \
+                not g.get('read_only'):
+            return None
+
+        if 'replica_engine' not in g:
+            if self.is_sticky():
+                g.replica_engine = None
+            else:
+                engines = self.engines()
+                g.replica_engine = engines[next(self._counter) % len(engines)]
+        return g.replica_engine
+
+    def mark_write(self):
+        """Keep the current client on the primary for a while."""
+        if not self.urls or not has_request_context():
+            return
+
+        until = time.time() + self.sticky_seconds
+        g.read_primary_until = until
+        client = self.client_id()
+        if client is None:
+            return
+
+        with self._lock:
+            self._recent_writers[client] = until
+            now = time.time()
+            for key in [key for key, expires in self._recent_writers.items()
+                        if expires <= now]:
+                del self._recent_writers[key]
+
+    def set_sticky_cookie(self, response):
+        until = g.get('read_primary_until')
+        if until is not None:
+            response.set_cookie(STICKY_COOKIE, '{:.3f}'.format(until),
+                                max_age=self.sticky_seconds, httponly=True)
+        return response
+
+
+# The current app's router. Each app gets its own in setup_db.
+replica_router = LocalProxy(
+    lambda: current_app.extensions['replica_router'])
+
+
+class RoutingSession(SignallingSession):
+    """A session that reads from a replica inside read-only requests."""
+
+    def router(self):
+        return self.app.extensions.get('replica_router')
+
+    def get_bind(self, mapper=None, clause=None):
+        router = self.router()
+        engine = router.engine_for_request() if router else None
+        if engine is not None:
+            return engine
+        return super().get_bind(mapper, clause)
+
+    def commit(self):
+        super().commit()
+        router = self.router()
+        if router is not None:
+            router.mark_write()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with read-replica aware sessions."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_only(f):
+    """Mark a view as safe to serve from a read replica."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return f(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,102 @@
+from datetime import date
+from flask import request, abort
+from sqlalchemy import func
+
+
+MATCH_MODES = ('prefix', 'contains')
+MOVIE_SORTS = ('id', 'release_date', '-release_date')
+
+
+def get_int_arg(name):
+    """Read an optional integer query parameter, aborting if invalid."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+
+def get_date_arg(name):
+    """Read an optional ISO date query parameter, aborting if invalid."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+
+def text_filter(column, term):
+    """Case-insensitive prefix or substring match on `column`.
+
+    Both modes compare against lower(column) so PostgreSQL can use the
+    lower() btree (prefix) and trigram (substring) indexes. SQLite runs the
+    same LIKE without them.
+    """
+    match = request.args.get('match', 'prefix')
+    if match not in MATCH_MODES:
+        abort(400)
+
+    term = term.lower().replace('\\', '\\\\') \
+        .replace('%', '\\%').replace('_', '\\_')
+    pattern = term + '%' if match == 'prefix' else '%' + term + '%'
+    return func.lower(column).like(pattern, escape='\\')
+
+
+def filter_actors(query, model):
+    """Apply the name, gender, age_min and age_max filters."""
+    name = request.args.get('name')
+    if name:
+        query = query.filter(text_filter(model.name, name))
+
+    gender = request.args.get('gender')
+    if gender:
+        query = query.filter(func.lower(model.gender) == gender.lower())
+
+    age_min = get_int_arg('age_min')
+    if age_min is not None:
+        query = query.filter(model.age >= age_min)
+
+    age_max = get_int_arg('age_max')
+    if age_max is not None:
+        query = query.filter(model.age <= age_max)
+
+    return query
+
+
+def filter_movies(query, model):
+    """Apply the title, released_after and released_before filters."""
+    title = request.args.get('title')
+    if title:
+        query = query.filter(text_filter(model.title, title))
+
+    released_after = get_date_arg('released_after')
+    if released_after is not None:
+        query = query.filter(model.released_on > released_after)
+
+    released_before = get_date_arg('released_before')
+    if released_before is not None:
+        query = query.filter(model.released_on < released_before)
+
+    if movie_sort(model)[0][0] is model.released_on:
+        query = query.filter(model.released_on.isnot(None))
+
+    return query
+
+
+def movie_sort(model):
+    """Return the keyset columns and direction for the `sort` parameter.
+
+    Sorting by release date walks the (released_on, id) index, so movies
+    without a parsable release date are left out of those listings.
+    """
+    sort = request.args.get('sort', 'id')
+    if sort not in MOVIE_SORTS:
+        abort(400)
+
+    if sort == 'id':
+        return (model.id,), False
+    return (model.released_on, model.id), sort.startswith('-')
@@ -0,0 +1,5 @@
+from app import create_app
+
+# Building the app opens no connections, so workers forked from a
+# `gunicorn --preload` master each start with their own empty pools.
+app = create_app()